@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+import core
+from followup import AnswerCache, ask_followup, stats as followup_stats
+from feedback_store import get_store, description_key
+from hts import extract_hts_code
+from tracing import collect, stage_timings, prometheus_text
+
+# Headless HTTP entry point over the same core functions as the Streamlit
+# app. The OpenAI and Pinecone clients are synchronous, so calls run on a
+# bounded thread pool that shares their connection pools; the event loop
+# only does admission, coalescing and caching.
+
+MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "16"))
+MAX_QUEUE = int(os.getenv("API_MAX_QUEUE", "256"))
+MAX_BATCH = int(os.getenv("API_MAX_BATCH", "100"))
+REQUEST_TIMEOUT = float(os.getenv("API_REQUEST_TIMEOUT", "120"))
+RESULT_CACHE_SIZE = int(os.getenv("API_RESULT_CACHE_SIZE", "5000"))
+RESULT_CACHE_TTL = float(os.getenv("API_RESULT_CACHE_TTL", str(6 * 3600)))
+# Serve classifications users have confirmed as correct from the feedback store
+USE_CONFIRMED = os.getenv("API_USE_CONFIRMED", "") == "1"
+API_KEY = os.getenv("API_KEY", "")
+
+class Overloaded(Exception):
+    pass
+
+class Classifier:
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE):
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="classify")
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.in_flight = {}
+        self.results = AnswerCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+        self.counts = {"model": 0, "cache": 0, "coalesced": 0, "confirmed": 0, "rejected": 0}
+
+    def key(self, description, country, image_data):
+        image = hashlib.sha1(image_data.encode()).hexdigest() if image_data else ""
+        return (description_key(description), country or "Not specified", image)
+
+    async def run(self, fn, *args):
+        # Admission control: refuse instead of queueing without bound
+        if self.waiting >= self.max_queue:
+            self.counts["rejected"] += 1
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, fn, *args)
+        finally:
+            self.slots.release()
+
+    def _classify(self, description, country, image_data):
+        with collect() as spans:
+            classification, similar_rulings = core.classify_product(
+                core.with_country(description, country), image_data)
+        return {
+            "classification": classification,
+            "hts_code": extract_hts_code(classification),
+            "similar_rulings": similar_rulings,
+            "timings_ms": {k: round(v * 1000, 1) for k, v in stage_timings(spans).items()},
+        }
+
+    def _confirmed(self, description, country):
+        row = get_store().lookup_confirmed(description, country)
+        if row is None:
+            return None
+        return {
+            "classification": row["classification"],
+            "hts_code": row["hts_code"],
+            "similar_rulings": [{"ruling_number": r} for r in row["ruling_ids"]],
+            "timings_ms": {},
+        }
+
+    async def classify(self, description, country=None, image_data=None):
+        key = self.key(description, country, image_data)
+        cached = self.results.get(key)
+        if cached is not None:
+            self.counts["cache"] += 1
+            return {**cached, "source": "cache"}
+
+        # Identical descriptions already being classified share one call
+        pending = self.in_flight.get(key)
+        if pending is not None:
+            self.counts["coalesced"] += 1
+            return {**(await asyncio.shield(pending)), "source": "coalesced"}
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            result = None
+            source = "model"
+            if USE_CONFIRMED and not image_data:
+                result = await self.run(self._confirmed, description, country or "Not specified")
+                source = "confirmed"
+            if result is None:
+                result = await self.run(self._classify, description, country, image_data)
+                source = "model"
+            self.counts[source] += 1
+            self.results.put(key, result)
+            future.set_result(result)
+            return {**result, "source": source}
+        except BaseException as e:
+            # A timed-out owner is cancelled; its waiters should time out too
+            future.set_exception(e if isinstance(e, Exception) else asyncio.TimeoutError())
+            # Mark it retrieved so an uncoalesced failure doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+
+    async def followup(self, question, classification, description, country):
+        return await self.run(ask_followup, core.openai_client, question, classification, description, country)
+
+def error(status, message, **headers):
+    return web.json_response({"error": message}, status=status, headers=headers)
+
+def optional_str(body, field):
+    value = body.get(field)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{field} must be a string")
+    return value
+
+def parse_item(item):
+    if not isinstance(item, dict):
+        raise ValueError("each item must be an object")
+    description = (optional_str(item, "description") or "").strip()
+    if not description:
+        raise ValueError("description is required")
+    return description, optional_str(item, "country"), optional_str(item, "image_base64")
+
+@web.middleware
+async def guard(request, handler):
+    if API_KEY and request.path not in ("/healthz", "/metrics") and request.headers.get("X-API-Key") != API_KEY:
+        return error(401, "invalid API key")
+    try:
+        return await asyncio.wait_for(handler(request), REQUEST_TIMEOUT)
+    except Overloaded:
+        return error(503, "server busy, retry later", **{"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        return error(504, "request timed out")
+    except ValueError as e:
+        return error(400, str(e))
+
+async def classify_handler(request):
+    body = await request.json()
+    description, country, image_data = parse_item(body)
+    return web.json_response(await request.app["classifier"].classify(description, country, image_data))
+
+async def batch_handler(request):
+    body = await request.json()
+    items = body.get("items") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError("items must be a non-empty list")
+    if len(items) > MAX_BATCH:
+        raise ValueError(f"at most {MAX_BATCH} items per batch")
+    parsed = [parse_item(item) for item in items]
+    classifier = request.app["classifier"]
+
+    async def one(description, country, image_data):
+        try:
+            return await classifier.classify(description, country, image_data)
+        except Overloaded:
+            return {"error": "server busy, retry later"}
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+    # Items share the same admission limits as single requests
+    results = await asyncio.gather(*(one(*p) for p in parsed))
+    return web.json_response({"results": results})
+
+async def followup_handler(request):
+    body = await request.json()
+    if not isinstance(body, dict):
+        raise ValueError("request body must be an object")
+    question = (optional_str(body, "question") or "").strip()
+    classification = optional_str(body, "classification") or ""
+    if not question or not classification:
+        raise ValueError("question and classification are required")
+    answer = await request.app["classifier"].followup(
+        question, classification, optional_str(body, "description") or "",
+        optional_str(body, "country") or "Not specified")
+    return web.json_response({"answer": answer})
+
+async def health_handler(request):
+    classifier = request.app["classifier"]
+    return web.json_response({
+        "status": "ok",
+        "in_flight": len(classifier.in_flight),
+        "waiting": classifier.waiting,
+        "classify": classifier.counts,
+        "followup": followup_stats.summary(),
+    })
+
+async def metrics_handler(request):
+    return web.Response(text=prometheus_text(), content_type="text/plain")
+
+def make_app():
+    app = web.Application(middlewares=[guard], client_max_size=20 * 1024 * 1024)
+
+    async def startup(app):
+        app["classifier"] = Classifier()
+        app["started"] = time.time()
+
+    async def cleanup(app):
+        app["classifier"].pool.shutdown(wait=False)
+
+    app.on_startup.append(startup)
+    app.on_cleanup.append(cleanup)
+    app.router.add_post("/classify", classify_handler)
+    app.router.add_post("/classify/batch", batch_handler)
+    app.router.add_post("/followup", followup_handler)
+    app.router.add_get("/healthz", health_handler)
+    app.router.add_get("/metrics", metrics_handler)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Async HTTP API for classification and follow-ups")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8080")))
+    args = parser.parse_args()
+    web.run_app(make_app(), host=args.host, port=args.port, access_log=None)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,12 @@
 import streamlit as st
 import os
 import base64
-import csv
-from datetime import datetime
-from dotenv import load_dotenv
-from openai import OpenAI
-from pinecone import Pinecone
+from core import openai_client, classify_product, with_country
+from tracing import start_metrics_server, collect, stage_timings
+from feedback_store import get_store
+from followup import ask_followup
 
-load_dotenv('C:/customs_ai2/.env')
-
-openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
-index = pc.Index(os.getenv('PINECONE_INDEX'))
+start_metrics_server()
 
 TARIFF_LAST_UPDATED = "February 18, 2026"
 STRIPE_LINK = "https://buy.stripe.com/9B69AT4pb09kaUP59724002"
@@ -146,123 +141,15 @@ def render_access():
         st.session_state["show_access"] = False
         st.rerun()
 
-def get_embedding(text):
-    response = openai_client.embeddings.create(
-        input=text[:8000],
-        model="text-embedding-ada-002"
-    )
-    return response.data[0].embedding
-
-def save_feedback(description, country, classification, was_correct):
-    feedback = {
-        "timestamp": datetime.now().isoformat(),
-        "description": description,
-        "country": country,
-        "classification": classification[:200],
-        "was_correct": was_correct
-    }
-    file_exists = os.path.exists("feedback.csv")
-    with open("feedback.csv", "a", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=feedback.keys())
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(feedback)
-
-def classify_product(description, image_data=None):
-    embedding = get_embedding(description)
-    results = index.query(vector=embedding, top_k=5, include_metadata=True)
-    
-    similar_rulings = []
-    for match in results.matches:
-        similar_rulings.append({
-            "ruling_number": match.metadata.get("ruling_number"),
-            "text": match.metadata.get("text"),
-            "url": match.metadata.get("url"),
-            "similarity": round(match.score, 3)
-        })
-    
-    context = "\n\n".join([
-        f"Ruling {r['ruling_number']} (similarity: {r['similarity']}):\n{r['text']}"
-        for r in similar_rulings
-    ])
-
-    prompt = f"""You are an expert US customs classification specialist with knowledge of current tariff rates.
-Based on the following similar CBP rulings, classify this product.
-
-SIMILAR CBP RULINGS:
-{context}
-
-PRODUCT DESCRIPTION:
-{description}
-
-Provide:
-1. HTS Code (10 digits)
-2. Confidence Level (High/Medium/Low)
-3. General duty rate from the HTS schedule (e.g. "Free", "3.5%", "6.7¢/kg")
-4. Country-specific tariffs based on country of origin if provided:
-   - Section 301 China tariffs if applicable (List 1/2/3/4A - specify rate)
-   - 2025 reciprocal/executive tariffs if applicable (note if paused or in flux)
-   - Any trade agreement benefits (USMCA free, KORUS FTA, CAFTA, etc.)
-   - Total estimated duty rate combining all applicable tariffs
-5. Reasoning based on the similar CBP rulings provided
-6. Most relevant ruling numbers that support this classification
-
-Be transparent about uncertainty on 2025 tariff rates."""
-
-    messages = []
-    if image_data:
-        messages.append({
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}}
-            ]
-        })
-    else:
-        messages.append({"role": "user", "content": prompt})
-    
-    response = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=messages,
-        max_tokens=800
-    )
-    
-    return response.choices[0].message.content, similar_rulings
-
-def ask_followup(question, classification, description, country):
-    prompt = f"""You are an expert US customs and trade compliance specialist.
-
-A product was just classified with the following result:
-
-PRODUCT: {description}
-COUNTRY OF ORIGIN: {country}
-CLASSIFICATION RESULT:
-{classification}
-
-The user has a follow-up question: {question}
-
-You may ONLY answer questions in these categories:
-- Required import documentation (CBP Form 3461, commercial invoice, packing list, bill of lading, etc.)
-- Whether the product is likely subject to antidumping (ADD) or countervailing duties (CVD)
-- Whether a customs bond is required
-- ISF (Importer Security Filing) requirements
-- FDA, USDA, or other agency filing requirements for this product type
-- What information must appear on the commercial invoice
-- Country of origin marking requirements (19 CFR Part 134)
-- HTS classification methodology questions
-
-If the question is outside these categories, or involves specific dollar thresholds, rates, or rules that change frequently, respond with:
-This question involves information that changes frequently and is outside the scope of what I can reliably answer. Please verify with a licensed customs broker or at cbp.gov.
-
-Do NOT include quotation marks in your response. Do NOT guess or provide outdated information. It is better to decline than to answer incorrectly.
-Answer concisely and practically. Name specific regulations where relevant."""
-
-    response = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=600
+def save_feedback(description, country, classification, was_correct, similar_rulings=None, timings=None):
+    get_store().record(
+        description,
+        country,
+        classification,
+        was_correct,
+        ruling_ids=[r["ruling_number"] for r in similar_rulings or []],
+        timings=timings
     )
-    return response.choices[0].message.content
 
 st.set_page_config(page_title="Customs Classifier AI", page_icon="🛃", layout="centered")
 
@@ -357,14 +244,17 @@ if classify_btn:
             image_data = None
             if image_file:
                 image_data = base64.b64encode(image_file.read()).decode('utf-8')
-            full_description = description
-            if country != "Not specified":
-                full_description = f"{description}\n\nCountry of Origin: {country}"
-            classification, similar_rulings = classify_product(full_description, image_data)
+            full_description = with_country(description, country)
+            with collect() as spans:
+                classification, similar_rulings = classify_product(full_description, image_data)
+            timings = {name: round(t * 1000, 1) for name, t in stage_timings(spans).items()}
 
         st.session_state["last_classification"] = classification
         st.session_state["last_description"] = description
         st.session_state["last_country"] = country
+        st.session_state["last_rulings"] = similar_rulings
+        st.session_state["last_timings"] = timings
+        st.session_state["feedback_given"] = None
 
         st.markdown("<div class='section-label'>Classification Result</div>", unsafe_allow_html=True)
         st.markdown(f"<div class='result-box'>{classification}</div>", unsafe_allow_html=True)
@@ -373,17 +263,6 @@ if classify_btn:
         for r in similar_rulings:
             st.markdown(f"<div class='ruling-item'>📄 <a href='{r['url']}' target='_blank'>{r['ruling_number']}</a> — similarity score: {r['similarity']}</div>", unsafe_allow_html=True)
 
-        st.markdown("<div class='section-label'>Was This Correct?</div>", unsafe_allow_html=True)
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("✅ Yes, correct", use_container_width=True):
-                save_feedback(description, country, classification, True)
-                st.success("Thanks for the feedback!")
-        with col2:
-            if st.button("❌ No, incorrect", use_container_width=True):
-                save_feedback(description, country, classification, False)
-                st.warning("Thanks — we'll use this to improve.")
-
         st.markdown(f"""
         <div class='footer-note'>
             For informational purposes only — not legal advice.<br>
@@ -392,6 +271,27 @@ if classify_btn:
         """, unsafe_allow_html=True)
 
 if "last_classification" in st.session_state:
+    # Outside the classify branch: clicking a button reruns the script with
+    # classify_btn False, so the result it rates comes from session state
+    st.markdown("<div class='section-label'>Was This Correct?</div>", unsafe_allow_html=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("✅ Yes, correct", use_container_width=True, disabled=st.session_state.get("feedback_given") is not None):
+            st.session_state["feedback_given"] = True
+            save_feedback(st.session_state["last_description"], st.session_state["last_country"],
+                          st.session_state["last_classification"], True,
+                          st.session_state.get("last_rulings"), st.session_state.get("last_timings"))
+    with col2:
+        if st.button("❌ No, incorrect", use_container_width=True, disabled=st.session_state.get("feedback_given") is not None):
+            st.session_state["feedback_given"] = False
+            save_feedback(st.session_state["last_description"], st.session_state["last_country"],
+                          st.session_state["last_classification"], False,
+                          st.session_state.get("last_rulings"), st.session_state.get("last_timings"))
+    if st.session_state.get("feedback_given") is True:
+        st.success("Thanks for the feedback!")
+    elif st.session_state.get("feedback_given") is False:
+        st.warning("Thanks — we'll use this to improve.")
+
     st.markdown("<div class='section-label'>Ask a Follow-up Question</div>", unsafe_allow_html=True)
     st.markdown("<div style='font-family:sans-serif; font-size:0.85em; color:#666; margin-bottom:8px;'>Examples: \"What import documents do I need?\" · \"Is this subject to ADD/CVD?\" · \"Do I need a customs bond?\" · \"What are the country of origin marking requirements?\"</div>", unsafe_allow_html=True)
     with st.form(key="followup_form"):
@@ -399,5 +299,5 @@ if "last_classification" in st.session_state:
         submitted = st.form_submit_button("Ask →", use_container_width=True)
     if submitted and followup:
         with st.spinner("Researching your question..."):
-            answer = ask_followup(followup, st.session_state["last_classification"], st.session_state["last_description"], st.session_state["last_country"])
+            answer = ask_followup(openai_client, followup, st.session_state["last_classification"], st.session_state["last_description"], st.session_state["last_country"])
         st.markdown(f"<div class='followup-box'>{answer}</div>", unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,141 @@
+import argparse
+import json
+import random
+import statistics
+import time
+from chunking import chunk_ruling, collapse_matches, is_truncated, QUERY_TOP_K
+from tracing import percentile
+
+RULINGS_FILE = 'C:/customs_ai2/rulings.json'
+EMBEDDING_DIM = 1536
+SINGLE_NS = "bench-single"
+CHUNKS_NS = "bench-chunks"
+
+# Compare the old one-vector-per-ruling layout against chunked indexing:
+# index growth offline, and (with --live) query latency and self-retrieval
+# against two scratch namespaces in the real index.
+
+def single_vectors(rulings):
+    return [{
+        "id": r['ruling_number'],
+        "text": r['text'][:8000],
+        "metadata": {
+            "ruling_number": r['ruling_number'],
+            "text": r['text'][:2000],
+            "url": r.get('url', '')
+        }
+    } for r in rulings]
+
+def chunk_vectors(rulings):
+    vectors = []
+    for r in rulings:
+        for c in chunk_ruling(r):
+            vectors.append({
+                "id": c['id'],
+                "text": c['text'],
+                "metadata": {
+                    "ruling_number": c['ruling_number'],
+                    "chunk": c['chunk'],
+                    "text": c['text'],
+                    "url": c['url']
+                }
+            })
+    return vectors
+
+def layout_size(vectors):
+    metadata_bytes = sum(len(json.dumps(v['metadata'])) for v in vectors)
+    embedded_chars = sum(len(v['text']) for v in vectors)
+    return {
+        "vectors": len(vectors),
+        "metadata_mb": metadata_bytes / 1e6,
+        "vector_mb": len(vectors) * EMBEDDING_DIM * 4 / 1e6,
+        "embedded_chars": embedded_chars
+    }
+
+def report_sizes(rulings):
+    single = layout_size(single_vectors(rulings))
+    chunked = layout_size(chunk_vectors(rulings))
+    print(f"Rulings sampled: {len(rulings):,}")
+    print(f"{'':18}{'single':>14}{'chunked':>14}{'ratio':>8}")
+    for key in ["vectors", "metadata_mb", "vector_mb", "embedded_chars"]:
+        a, b = single[key], chunked[key]
+        print(f"{key:18}{a:>14,.2f}{b:>14,.2f}{(b / a if a else 0):>8.2f}")
+    counts = [len(chunk_ruling(r)) for r in rulings]
+    print(f"Chunks per ruling: mean {statistics.mean(counts):.2f}, max {max(counts)}")
+    truncated = sum(1 for r in rulings if is_truncated(r))
+    print(f"Rulings over the chunk cap (middle not indexed): {truncated:,} ({truncated / len(rulings):.1%})")
+
+def run_live(rulings, queries):
+    import upload_to_pinecone as up
+    from core import get_embedding
+
+    for ns, vectors in [(SINGLE_NS, single_vectors(rulings)), (CHUNKS_NS, chunk_vectors(rulings))]:
+        for k in range(0, len(vectors), up.EMBEDDING_BATCH):
+            batch = vectors[k:k + up.EMBEDDING_BATCH]
+            embeddings = up.get_embeddings_batch([v['text'] for v in batch])
+            up.index.upsert(vectors=[
+                {"id": v['id'], "values": e, "metadata": v['metadata']}
+                for v, e in zip(batch, embeddings)
+            ], namespace=ns)
+    # Upserts are eventually consistent
+    time.sleep(10)
+
+    timings = {SINGLE_NS: [], CHUNKS_NS: []}
+    hits = {SINGLE_NS: 0, CHUNKS_NS: 0}
+    try:
+        for ruling_number, query in queries:
+            embedding = get_embedding(query)
+
+            start = time.perf_counter()
+            res = up.index.query(vector=embedding, top_k=5, include_metadata=True, namespace=SINGLE_NS)
+            timings[SINGLE_NS].append(time.perf_counter() - start)
+            if ruling_number in [m.metadata.get("ruling_number") for m in res.matches]:
+                hits[SINGLE_NS] += 1
+
+            start = time.perf_counter()
+            res = up.index.query(vector=embedding, top_k=QUERY_TOP_K, include_metadata=True, namespace=CHUNKS_NS)
+            found = collapse_matches(res.matches, top_k=5)
+            timings[CHUNKS_NS].append(time.perf_counter() - start)
+            if ruling_number in [r["ruling_number"] for r in found]:
+                hits[CHUNKS_NS] += 1
+    finally:
+        for ns in timings:
+            up.index.delete(delete_all=True, namespace=ns)
+
+    print(f"\nQuery latency over {len(queries)} queries (ms):")
+    for ns, values in timings.items():
+        ms = [v * 1000 for v in values]
+        print(f"  {ns:14} p50 {percentile(ms, 50):7.1f}  p95 {percentile(ms, 95):7.1f}  "
+              f"recall@5 {hits[ns] / len(queries):.2%}")
+
+def make_queries(rulings, n):
+    # Query with a passage from the holding at the end of the ruling, which
+    # the chunked layout always keeps and the single-vector layout loses
+    # past its truncation point
+    queries = []
+    for r in random.sample(rulings, min(n, len(rulings))):
+        text = r['text']
+        start = max(0, len(text) - 450)
+        queries.append((r['ruling_number'], text[start:start + 300]))
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunked vs single-vector ruling index")
+    parser.add_argument("--rulings", default=RULINGS_FILE)
+    parser.add_argument("--sample", type=int, default=2000)
+    parser.add_argument("--live", action="store_true", help="upsert the sample to scratch namespaces and time queries")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with open(args.rulings, 'r') as f:
+        rulings = json.load(f)
+    rulings = random.sample(rulings, min(args.sample, len(rulings)))
+
+    report_sizes(rulings)
+    if args.live:
+        run_live(rulings, make_queries(rulings, args.queries))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import logging
+import re
+
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 250
+MIN_CHUNK = 200
+MAX_CHUNKS_PER_RULING = 8
+# Of those, how many come from the end of a ruling that has more
+TAIL_CHUNKS = 3
+CHUNK_ID_SEP = "#"
+# Chunks fetched per query before collapsing to distinct rulings
+QUERY_TOP_K = 20
+
+log = logging.getLogger(__name__)
+
+# Sentence ends followed by whitespace, or blank lines between paragraphs
+SENTENCE_BREAK = re.compile(r"(?<=[.;:?!])\s+(?=[A-Z0-9(\"'])|\n\s*\n")
+
+def split_sentences(text):
+    parts = []
+    for block in SENTENCE_BREAK.split(text):
+        block = " ".join(block.split())
+        if not block:
+            continue
+        # Hard-wrap anything with no usable sentence break (tables, code lists)
+        while len(block) > CHUNK_SIZE:
+            cut = block.rfind(" ", 0, CHUNK_SIZE)
+            if cut <= 0:
+                cut = CHUNK_SIZE
+            parts.append(block[:cut])
+            block = block[cut:].strip()
+        if block:
+            parts.append(block)
+    return parts
+
+def all_chunks(text):
+    sentences = split_sentences(text)
+    chunks = []
+    current = []
+    size = 0
+    carried = 0
+    for sentence in sentences:
+        if current and size + len(sentence) + 1 > CHUNK_SIZE:
+            chunks.append(" ".join(current))
+            # Carry the tail of the previous chunk over so a holding that
+            # straddles the boundary is still embedded in one piece
+            carry = []
+            carry_size = 0
+            for prev in reversed(current):
+                if carry_size + len(prev) + 1 > CHUNK_OVERLAP:
+                    break
+                carry.insert(0, prev)
+                carry_size += len(prev) + 1
+            current = carry
+            size = carry_size
+            carried = len(carry)
+        current.append(sentence)
+        size += len(sentence) + 1
+    if current:
+        tail = " ".join(current)
+        # Fold a tiny trailing fragment into the previous chunk instead of
+        # paying for a vector that carries almost no signal. Only the new
+        # sentences are folded; the carried ones already end that chunk, so
+        # it grows by less than MIN_CHUNK.
+        if chunks and len(tail) < MIN_CHUNK:
+            chunks[-1] = chunks[-1] + " " + " ".join(current[carried:])
+        else:
+            chunks.append(tail)
+    return chunks
+
+def select_chunks(chunks):
+    # Over the cap, keep the facts at the head and the holding, which CBP
+    # rulings put at the end, and drop the middle
+    if len(chunks) <= MAX_CHUNKS_PER_RULING:
+        return chunks
+    head = MAX_CHUNKS_PER_RULING - TAIL_CHUNKS
+    return chunks[:head] + chunks[-TAIL_CHUNKS:]
+
+def chunk_text(text):
+    return select_chunks(all_chunks(text))
+
+def is_truncated(ruling):
+    return len(all_chunks(ruling["text"])) > MAX_CHUNKS_PER_RULING
+
+def chunk_ruling(ruling):
+    chunks = chunk_text(ruling["text"])
+    return [{
+        "id": f"{ruling['ruling_number']}{CHUNK_ID_SEP}{n}",
+        "ruling_number": ruling["ruling_number"],
+        "chunk": n,
+        "text": text,
+        "url": ruling.get("url", "")
+    } for n, text in enumerate(chunks)]
+
+def chunk_texts(corpus, ruling_number, cache):
+    # Vectors uploaded with --ids-only carry no text; it is re-chunked from
+    # the stored ruling, once per ruling per query
+    if corpus is None:
+        raise RuntimeError(f"{ruling_number} was indexed without text and no ruling corpus is "
+                           f"available; build one with `python corpus.py build` or set CORPUS_FILE")
+    if ruling_number not in cache:
+        ruling = corpus.get(ruling_number)
+        cache[ruling_number] = (ruling.get("url", ""), [c["text"] for c in chunk_ruling(ruling)]) if ruling else None
+    return cache[ruling_number]
+
+def collapse_matches(matches, top_k=5, max_text=2000, corpus=None):
+    # Max-sim: a ruling scores as its best chunk; keep every hit chunk of
+    # the ruling so the prompt sees all the passages that matched
+    rulings = {}
+    for match in matches:
+        meta = match.metadata or {}
+        number = meta.get("ruling_number") or match.id.split(CHUNK_ID_SEP)[0]
+        entry = rulings.get(number)
+        if entry is None:
+            entry = rulings[number] = {
+                "ruling_number": number,
+                "url": meta.get("url", ""),
+                "score": match.score,
+                "chunks": []
+            }
+        entry["score"] = max(entry["score"], match.score)
+        entry["chunks"].append((int(meta.get("chunk", 0)), meta.get("text", "")))
+
+    ranked = sorted(rulings.values(), key=lambda r: r["score"], reverse=True)
+    similar_rulings = []
+    loaded = {}
+    for r in ranked:
+        if len(similar_rulings) == top_k:
+            break
+        if any(not t for _, t in r["chunks"]):
+            stored = chunk_texts(corpus, r["ruling_number"], loaded)
+            if stored is None:
+                # A ruling without text would still be counted as agreeing
+                # evidence by the router, so leave it out entirely
+                log.warning("ruling %s is in the index but not in %s; skipping it",
+                            r["ruling_number"], corpus.path)
+                continue
+            url, texts = stored
+            r["url"] = r["url"] or url
+            r["chunks"] = [(n, t or (texts[n] if n < len(texts) else "")) for n, t in r["chunks"]]
+            if not all(t for _, t in r["chunks"]):
+                log.warning("ruling %s in %s has fewer chunks than were indexed; re-upload it",
+                            r["ruling_number"], corpus.path)
+                r["chunks"] = [(n, t) for n, t in r["chunks"] if t]
+                if not r["chunks"]:
+                    continue
+        text = " ... ".join(t for _, t in sorted(r["chunks"]))
+        similar_rulings.append({
+            "ruling_number": r["ruling_number"],
+            "text": text[:max_text],
+            "url": r["url"],
+            "similarity": round(r["score"], 3)
+        })
+    return similar_rulings
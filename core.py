@@ -0,0 +1,92 @@
+import os
+from dotenv import load_dotenv
+from openai import OpenAI
+from pinecone import Pinecone
+from chunking import collapse_matches, QUERY_TOP_K
+from corpus import get_corpus
+from tracing import span, traced
+import router
+
+load_dotenv('C:/customs_ai2/.env')
+
+# Created once per process and shared by every Streamlit session and API
+# request; both clients pool their HTTP connections
+INDEX_POOL_SIZE = int(os.getenv('INDEX_POOL_SIZE', '32'))
+
+openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
+index = pc.Index(os.getenv('PINECONE_INDEX'), host=os.getenv('PINECONE_HOST', ''),
+                 connection_pool_maxsize=INDEX_POOL_SIZE)
+
+def with_country(description, country):
+    if country and country != "Not specified":
+        return f"{description}\n\nCountry of Origin: {country}"
+    return description
+
+def get_embedding(text):
+    with span("classify.embed", model="text-embedding-ada-002") as s:
+        response = openai_client.embeddings.create(
+            input=text[:8000],
+            model="text-embedding-ada-002"
+        )
+        s.record_usage(response)
+        s.add_bytes(bytes_out=len(text[:8000].encode()))
+    return response.data[0].embedding
+
+@traced("classify")
+def classify_product(description, image_data=None):
+    embedding = get_embedding(description)
+    with span("classify.query", top_k=QUERY_TOP_K) as s:
+        results = index.query(vector=embedding, top_k=QUERY_TOP_K, include_metadata=True)
+        s.add_bytes(bytes_in=sum(len((m.metadata or {}).get("text", "")) for m in results.matches))
+    with span("classify.collapse"):
+        similar_rulings = collapse_matches(results.matches, top_k=5, corpus=get_corpus())
+    
+    context = "\n\n".join([
+        f"Ruling {r['ruling_number']} (similarity: {r['similarity']}):\n{r['text']}"
+        for r in similar_rulings
+    ])
+
+    prompt = f"""You are an expert US customs classification specialist with knowledge of current tariff rates.
+Based on the following similar CBP rulings, classify this product.
+
+SIMILAR CBP RULINGS:
+{context}
+
+PRODUCT DESCRIPTION:
+{description}
+
+Provide:
+1. HTS Code (10 digits)
+2. Confidence Level (High/Medium/Low)
+3. General duty rate from the HTS schedule (e.g. "Free", "3.5%", "6.7¢/kg")
+4. Country-specific tariffs based on country of origin if provided:
+   - Section 301 China tariffs if applicable (List 1/2/3/4A - specify rate)
+   - 2025 reciprocal/executive tariffs if applicable (note if paused or in flux)
+   - Any trade agreement benefits (USMCA free, KORUS FTA, CAFTA, etc.)
+   - Total estimated duty rate combining all applicable tariffs
+5. Reasoning based on the similar CBP rulings provided
+6. Most relevant ruling numbers that support this classification
+
+Be transparent about uncertainty on 2025 tariff rates."""
+
+    messages = []
+    if image_data:
+        messages.append({
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}}
+            ]
+        })
+    else:
+        messages.append({"role": "user", "content": prompt})
+    
+    classification = router.complete(
+        openai_client,
+        messages,
+        max_tokens=800,
+        similar_rulings=similar_rulings
+    )
+    
+    return classification, similar_rulings
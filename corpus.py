@@ -0,0 +1,305 @@
+import argparse
+import json
+import mmap
+import os
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from tracing import percentile
+
+CORPUS_FILE = os.getenv("CORPUS_FILE", "C:/customs_ai2/rulings.corpus")
+BLOCK_SIZE = 64 * 1024
+COMPRESS_LEVEL = 6
+BLOCK_CACHE = 64
+
+# Layout, all integers little-endian:
+#   header   MAGIC
+#   blocks   zlib-compressed runs of newline-separated JSON records
+#   blocks   table of (file offset u64, compressed len u32, raw len u32,
+#            first record u32, record count u32) per block
+#   index    (ruling number 16s, block u32, offset u32, length u32) sorted
+#            by ruling number, fixed width so it can be binary searched in
+#            place through mmap without loading it
+#   footer   (blocks offset u64, block count u32, index offset u64,
+#            record count u32, MAGIC)
+#
+# Each build writes a new <path>.<version> data file and then points <path>
+# at it; <path> is a one-line file naming the current version. Readers only
+# keep the versioned file mapped, so a rebuild never has to replace a file
+# that is open, which Windows refuses to do. A <path> that is itself a data
+# file, from before versioning, is still read directly.
+MAGIC = b"RCORPUS1"
+KEY_SIZE = 16
+BLOCK_ENTRY = struct.Struct("<QIIII")
+INDEX_ENTRY = struct.Struct(f"<{KEY_SIZE}sIII")
+FOOTER = struct.Struct("<QIQI8s")
+
+def encode_key(ruling_number):
+    key = ruling_number.encode()
+    if len(key) > KEY_SIZE:
+        raise ValueError(f"ruling number too long for index: {ruling_number}")
+    return key.ljust(KEY_SIZE, b"\0")
+
+VERSION_SUFFIX = re.compile(r"\.\d+$")
+
+def resolve(path):
+    # The data file a corpus path currently refers to
+    with open(path, "rb") as f:
+        head = f.read(64)
+    if head.startswith(MAGIC):
+        return path
+    return os.path.join(os.path.dirname(path), head.decode().strip())
+
+def remove_old_versions(path, keep):
+    folder = os.path.dirname(path) or "."
+    base = os.path.basename(path)
+    for name in os.listdir(folder):
+        if name != keep and name.startswith(base + ".") and VERSION_SUFFIX.search(name):
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                # Still mapped by a reader; removed after a later build
+                pass
+
+def write_corpus(rulings, path, block_size=BLOCK_SIZE, level=COMPRESS_LEVEL):
+    # Records keep their source order in the blocks so streaming matches
+    # rulings.json; a ruling scraped twice keeps its first position and its
+    # last contents
+    latest = {}
+    for ruling in rulings:
+        latest[ruling["ruling_number"]] = ruling
+    version = f"{os.path.basename(path)}.{time.time_ns()}"
+    data_path = os.path.join(os.path.dirname(path), version)
+    blocks = []
+    positions = {}
+    pending = []
+    pending_size = 0
+    with open(data_path, "wb") as f:
+        f.write(MAGIC)
+
+        def flush():
+            nonlocal pending, pending_size
+            raw = b"".join(pending)
+            data = zlib.compress(raw, level)
+            blocks.append((f.tell(), len(data), len(raw), len(positions) - len(pending), len(pending)))
+            f.write(data)
+            pending, pending_size = [], 0
+
+        for number, ruling in latest.items():
+            line = (json.dumps(ruling, separators=(",", ":")) + "\n").encode()
+            positions[number] = (len(blocks), pending_size, len(line) - 1)
+            pending.append(line)
+            pending_size += len(line)
+            if pending_size >= block_size:
+                flush()
+        if pending:
+            flush()
+
+        blocks_offset = f.tell()
+        for entry in blocks:
+            f.write(BLOCK_ENTRY.pack(*entry))
+        index_offset = f.tell()
+        for number in sorted(positions, key=encode_key):
+            f.write(INDEX_ENTRY.pack(encode_key(number), *positions[number]))
+        f.write(FOOTER.pack(blocks_offset, len(blocks), index_offset, len(positions), MAGIC))
+
+    # The pointer is only ever read and closed, so replacing it is safe while
+    # readers have the previous version mapped
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, path)
+    remove_old_versions(path, version)
+    return len(positions), len(blocks)
+
+class Corpus:
+    def __init__(self, path=CORPUS_FILE):
+        self.path = resolve(path)
+        # The map keeps its own handle, so nothing else holds the file open
+        with open(self.path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a ruling corpus")
+        (self.blocks_offset, self.block_count, self.index_offset,
+         self.count, magic) = FOOTER.unpack_from(self.map, len(self.map) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is truncated")
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.map.close()
+
+    def _block_entry(self, n):
+        return BLOCK_ENTRY.unpack_from(self.map, self.blocks_offset + n * BLOCK_ENTRY.size)
+
+    def _block(self, n):
+        with self.lock:
+            raw = self.cache.get(n)
+            if raw is not None:
+                self.cache.move_to_end(n)
+                return raw
+        offset, length, _, _, _ = self._block_entry(n)
+        raw = zlib.decompress(self.map[offset:offset + length])
+        with self.lock:
+            self.cache[n] = raw
+            while len(self.cache) > BLOCK_CACHE:
+                self.cache.popitem(last=False)
+        return raw
+
+    def _key_at(self, i):
+        return self.map[self.index_offset + i * INDEX_ENTRY.size:
+                        self.index_offset + i * INDEX_ENTRY.size + KEY_SIZE]
+
+    def locate(self, ruling_number):
+        # Binary search straight over the mmapped index
+        key = encode_key(ruling_number)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count or self._key_at(lo) != key:
+            return None
+        _, block, offset, length = INDEX_ENTRY.unpack_from(self.map, self.index_offset + lo * INDEX_ENTRY.size)
+        return block, offset, length
+
+    def get(self, ruling_number):
+        location = self.locate(ruling_number)
+        if location is None:
+            return None
+        block, offset, length = location
+        return json.loads(self._block(block)[offset:offset + length])
+
+    def __contains__(self, ruling_number):
+        return self.locate(ruling_number) is not None
+
+    def __iter__(self):
+        return self.iter_rulings()
+
+    def iter_rulings(self, start=0):
+        # Sequential scan in source order; whole blocks before `start` are
+        # skipped without decompressing them
+        for n in range(self.block_count):
+            offset, length, _, first, records = self._block_entry(n)
+            if first + records <= start:
+                continue
+            raw = zlib.decompress(self.map[offset:offset + length])
+            # json.dumps escapes newlines inside strings, so the separators
+            # are safe to turn into commas and decode the block in one call
+            rulings = json.loads(b"[" + raw.rstrip(b"\n").replace(b"\n", b",") + b"]")
+            yield from rulings[max(0, start - first):]
+
+    def ruling_numbers(self):
+        for i in range(self.count):
+            yield self._key_at(i).rstrip(b"\0").decode()
+
+_corpus = None
+_corpus_stamp = None
+_corpus_lock = threading.Lock()
+
+def get_corpus():
+    # Shared read-only handle; None when no corpus has been built yet. A
+    # rebuild changes the pointer's mtime and the new version is opened; the
+    # old one is unmapped once requests still using it let go of it
+    global _corpus, _corpus_stamp
+    with _corpus_lock:
+        try:
+            stamp = os.stat(CORPUS_FILE).st_mtime_ns
+        except FileNotFoundError:
+            return _corpus
+        if _corpus is None or stamp != _corpus_stamp:
+            _corpus = Corpus(CORPUS_FILE)
+            _corpus_stamp = stamp
+        return _corpus
+
+def bench(json_path, corpus_path, lookups):
+    json_size = os.path.getsize(json_path)
+    corpus_size = os.path.getsize(resolve(corpus_path))
+    print(f"Size: JSON {json_size / 1e6:,.1f} MB, corpus {corpus_size / 1e6:,.1f} MB "
+          f"({corpus_size / json_size:.1%})")
+
+    # JSON: any access means parsing the whole array first
+    start = time.perf_counter()
+    with open(json_path) as f:
+        rulings = json.load(f)
+    json_load = time.perf_counter() - start
+    by_number = {r["ruling_number"]: r for r in rulings}
+    sample = random.sample(list(by_number), min(lookups, len(by_number)))
+
+    start = time.perf_counter()
+    corpus = Corpus(corpus_path)
+    corpus_open = time.perf_counter() - start
+
+    print(f"\nFirst lookup in a fresh process:")
+    print(f"  JSON    {json_load * 1000:10.1f} ms (parse whole file)")
+    first = time.perf_counter()
+    corpus.get(sample[0])
+    print(f"  corpus  {(corpus_open + time.perf_counter() - first) * 1000:10.3f} ms (open + lookup)")
+
+    timings = []
+    for number in sample:
+        corpus.cache.clear()
+        start = time.perf_counter()
+        record = corpus.get(number)
+        timings.append((time.perf_counter() - start) * 1e6)
+        assert record == by_number[number], number
+    print(f"\nRandom lookups ({len(sample):,}, block cache cleared each time):")
+    print(f"  corpus  p50 {percentile(timings, 50):8.1f} us  p95 {percentile(timings, 95):8.1f} us  "
+          f"p99 {percentile(timings, 99):8.1f} us")
+
+    start = time.perf_counter()
+    with open(json_path) as f:
+        count = sum(1 for _ in json.load(f))
+    json_scan = time.perf_counter() - start
+    start = time.perf_counter()
+    scanned = sum(1 for _ in corpus.iter_rulings())
+    corpus_scan = time.perf_counter() - start
+    print(f"\nFull scan:")
+    print(f"  JSON    {count / json_scan:12,.0f} rulings/s  {json_size / 1e6 / json_scan:8.1f} MB/s of source")
+    print(f"  corpus  {scanned / corpus_scan:12,.0f} rulings/s  {json_size / 1e6 / corpus_scan:8.1f} MB/s of source")
+    corpus.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed, randomly addressable ruling corpus")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="convert rulings.json to a corpus file")
+    build.add_argument("source", nargs="?", default="C:/customs_ai2/rulings.json")
+    build.add_argument("output", nargs="?", default=CORPUS_FILE)
+    build.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    get = sub.add_parser("get", help="print one ruling")
+    get.add_argument("ruling_number")
+    get.add_argument("--corpus", default=CORPUS_FILE)
+    b = sub.add_parser("bench", help="compare size, lookups and scans against the JSON file")
+    b.add_argument("source", nargs="?", default="C:/customs_ai2/rulings.json")
+    b.add_argument("corpus", nargs="?", default=CORPUS_FILE)
+    b.add_argument("--lookups", type=int, default=1000)
+    b.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with open(args.source) as f:
+            rulings = json.load(f)
+        start = time.perf_counter()
+        records, blocks = write_corpus(rulings, args.output, args.block_size)
+        print(f"Wrote {records:,} of {len(rulings):,} records in {blocks:,} blocks to {args.output} "
+              f"in {time.perf_counter() - start:.1f}s")
+    elif args.command == "get":
+        corpus = Corpus(args.corpus)
+        record = corpus.get(args.ruling_number)
+        print(json.dumps(record, indent=2) if record else f"{args.ruling_number} not found")
+    else:
+        random.seed(args.seed)
+        bench(args.source, args.corpus, args.lookups)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import argparse
+import csv
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hts import extract_hts_code, heading, subheading, normalize_hts
+from tracing import collect, stage_timings, percentile
+from feedback_store import FEEDBACK_DB
+import router
+
+GOLDEN_FILE = "eval_golden.jsonl"
+STAGES = ["classify.embed", "classify.query", "classify.chat"]
+TUNE_CONFIDENCE = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95]
+TUNE_AGREEMENT = [0.0, 0.5, 0.6, 0.75, 0.9]
+TUNE_SIMILARITY = [0.0, 0.75, 0.8, 0.85, 0.9]
+
+# Replays a labeled set through core.classify_product() and reports
+# accuracy, per-stage latency, token use and throughput. Run with --stubs to
+# measure the pipeline against local stand-ins (stub_services.py) instead of
+# the paid APIs; accuracy there only checks that retrieval and parsing still
+# line up, use the real services for accuracy numbers.
+
+def load_golden(path):
+    cases = []
+    if not os.path.exists(path):
+        return cases
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                case = json.loads(line)
+                case["source"] = "golden"
+                cases.append(case)
+    return cases
+
+def feedback_case(description, country, code, correct):
+    # Rows marked correct give us the label; rows marked incorrect only tell
+    # us which code not to repeat
+    return {
+        "description": description,
+        "country": country or "Not specified",
+        "hts_code": code if correct else "",
+        "rejected_code": "" if correct else code,
+        "source": "feedback"
+    }
+
+def load_feedback(path):
+    cases = []
+    if not os.path.exists(path):
+        return cases
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                code = extract_hts_code(row.get("classification", ""))
+                if code:
+                    cases.append(feedback_case(row["description"], row.get("country"), code,
+                                               str(row.get("was_correct")).lower() == "true"))
+        return cases
+    from feedback_store import FeedbackReader
+    store = FeedbackReader(path)
+    for row in store.query():
+        if row["hts_code"]:
+            cases.append(feedback_case(row["description"], row["country"], row["hts_code"], row["was_correct"]))
+    store.close()
+    return cases
+
+SYNTHETIC_TEMPLATES = [
+    "The merchandise under consideration is described as {description}. The applicable subheading will be {code}, HTSUS.",
+    "This ruling concerns the tariff classification of {description}. In your letter you suggested another provision; the correct classification is {code}.",
+    "The item is {description}. Based on the information provided, it is classifiable under {code}, Harmonized Tariff Schedule of the United States.",
+]
+
+def synthetic_rulings(cases):
+    # Stand-in corpus for stub runs: a few rulings per labeled case, so the
+    # retrieved set usually agrees the way it does for easy real queries
+    rulings = []
+    labeled = [c for c in cases if c["hts_code"]]
+    for n, case in enumerate(labeled):
+        for k, template in enumerate(SYNTHETIC_TEMPLATES):
+            rulings.append({
+                "ruling_number": f"S{n:05d}{k}",
+                "url": "",
+                "text": template.format(description=case["description"], code=case["hts_code"])
+            })
+    return rulings
+
+def seed_stub_index(services, rulings):
+    from chunking import chunk_ruling
+    vectors = []
+    for ruling in rulings:
+        for c in chunk_ruling(ruling):
+            vectors.append({"id": c["id"], "metadata": {
+                "ruling_number": c["ruling_number"], "chunk": c["chunk"],
+                "text": c["text"], "url": c["url"]}})
+    services.seed(vectors)
+    return len(vectors)
+
+def run_case(core, case):
+    description = core.with_country(case["description"], case.get("country"))
+    record = {"case": case, "error": ""}
+    start = time.perf_counter()
+    with collect() as spans:
+        try:
+            classification, similar_rulings = core.classify_product(description)
+            record["predicted"] = extract_hts_code(classification)
+            record["rulings"] = [r["ruling_number"] for r in similar_rulings]
+        except Exception as e:
+            record["predicted"] = ""
+            record["error"] = str(e)
+    record["total"] = time.perf_counter() - start
+    record["stages"] = stage_timings(spans)
+    record["tokens"] = {}
+    for s in spans:
+        # Tier calls roll up into the chat stage they were routed from
+        stage = "classify.chat" if s.name in ("classify.small", "classify.large") else s.name
+        record["tokens"][stage] = record["tokens"].get(stage, 0) + s.tokens_in + s.tokens_out
+        if s.name == "classify.chat":
+            record["route"] = dict(s.attrs)
+        elif s.name in ("classify.small", "classify.large"):
+            tier = s.name.split(".")[1]
+            record.setdefault("tier_cost", {})[tier] = s.cost()
+            record.setdefault("tier_ms", {})[tier] = s.duration * 1000
+    return record
+
+def summarize(records, wall, concurrency):
+    summary = {"cases": len(records), "errors": sum(1 for r in records if r["error"]),
+               "concurrency": concurrency, "accuracy": {}, "latency_ms": {}, "tokens_per_request": {}}
+
+    for source in ["golden", "feedback", "all"]:
+        labeled = [r for r in records if r["case"]["hts_code"]
+                   and (source == "all" or r["case"]["source"] == source)]
+        if not labeled:
+            continue
+        summary["accuracy"][source] = {
+            "n": len(labeled),
+            "heading": sum(heading(r["predicted"]) == heading(r["case"]["hts_code"]) for r in labeled) / len(labeled),
+            "subheading": sum(subheading(r["predicted"]) == subheading(r["case"]["hts_code"]) for r in labeled) / len(labeled),
+        }
+    rejected = [r for r in records if r["case"].get("rejected_code")]
+    if rejected:
+        summary["accuracy"]["rejected_repeated"] = {
+            "n": len(rejected),
+            "rate": sum(normalize_hts(r["predicted"]) == normalize_hts(r["case"]["rejected_code"])
+                        for r in rejected) / len(rejected)
+        }
+
+    for stage in STAGES + ["total"]:
+        values = [(r["total"] if stage == "total" else r["stages"].get(stage, 0.0)) * 1000
+                  for r in records if not r["error"]]
+        summary["latency_ms"][stage] = {p: percentile(values, int(p[1:])) for p in ["p50", "p95", "p99"]}
+    for stage in ["classify.embed", "classify.chat"]:
+        summary["tokens_per_request"][stage] = sum(r["tokens"].get(stage, 0) for r in records) / max(1, len(records))
+    summary["throughput_rps"] = len(records) / wall if wall else 0.0
+    return summary
+
+def replay_route(record, limits):
+    # Re-run the routing decision offline from a shadow run, where both
+    # tiers answered every case
+    route = record["route"]
+    args = (route.get("agreement"), route.get("top_heading"), route.get("top_similarity"))
+    tier, _ = router.decide(limits, *args, None)
+    tried_small = tier == "small"
+    if tried_small:
+        small = {"hts_code": route.get("small_code", ""), "confidence": route.get("small_confidence", 0.0)}
+        tier, _ = router.decide(limits, *args, small)
+    cost = ms = 0.0
+    for t in (["small"] if tried_small else []) + (["large"] if tier == "large" else []):
+        cost += record.get("tier_cost", {}).get(t, 0.0)
+        ms += record.get("tier_ms", {}).get(t, 0.0)
+    code = route.get("small_code", "") if tier == "small" else route.get("large_code", "")
+    return code, tier, cost, ms
+
+def tune_routing(records, max_drop):
+    rows = [r for r in records if r["case"]["hts_code"] and "large_code" in r.get("route", {})]
+    if not rows:
+        print("\nNo shadow routing data to tune on.")
+        return None
+
+    def score(limits):
+        correct = escalated = 0
+        cost = ms = 0.0
+        for r in rows:
+            code, tier, c, t = replay_route(r, limits)
+            correct += subheading(code) == subheading(r["case"]["hts_code"])
+            escalated += tier == "large"
+            cost += c
+            ms += t
+        return {**limits, "accuracy": correct / len(rows), "escalated": escalated / len(rows),
+                "cost_per_request": cost / len(rows), "chat_ms": ms / len(rows)}
+
+    large_only = {
+        "accuracy": sum(subheading(r["route"]["large_code"]) == subheading(r["case"]["hts_code"])
+                        for r in rows) / len(rows),
+        "cost_per_request": sum(r.get("tier_cost", {}).get("large", 0.0) for r in rows) / len(rows),
+        "chat_ms": sum(r.get("tier_ms", {}).get("large", 0.0) for r in rows) / len(rows),
+    }
+    results = [score({"min_confidence": c, "min_agreement": a, "min_similarity": s})
+               for c in TUNE_CONFIDENCE for a in TUNE_AGREEMENT for s in TUNE_SIMILARITY]
+    eligible = [r for r in results if r["accuracy"] >= large_only["accuracy"] - max_drop]
+    eligible.sort(key=lambda r: (r["cost_per_request"], -r["accuracy"]))
+
+    print(f"\nRouting thresholds over {len(rows)} labeled cases (subheading accuracy)")
+    print(f"  {router.LARGE_MODEL + ' only':34} accuracy {large_only['accuracy']:.1%}  "
+          f"cost/req ${large_only['cost_per_request']:.5f}  chat {large_only['chat_ms']:.0f} ms")
+    print(f"  {'conf':>6}{'agree':>7}{'sim':>6}{'accuracy':>10}{'escalated':>11}{'cost/req':>11}{'chat ms':>9}")
+    for r in eligible[:10]:
+        print(f"  {r['min_confidence']:>6.2f}{r['min_agreement']:>7.2f}{r['min_similarity']:>6.2f}"
+              f"{r['accuracy']:>10.1%}{r['escalated']:>11.1%}{r['cost_per_request']:>11.5f}{r['chat_ms']:>9.0f}")
+    if not eligible:
+        print("  No threshold setting stays within the allowed accuracy drop.")
+        return None
+    best = eligible[0]
+    print(f"\nSuggested: ROUTER_MIN_CONFIDENCE={best['min_confidence']} "
+          f"ROUTER_MIN_AGREEMENT={best['min_agreement']} ROUTER_MIN_SIMILARITY={best['min_similarity']}")
+    return best
+
+def print_summary(summary, baseline=None):
+    def delta(path, value, lower_is_better=True):
+        if not baseline:
+            return ""
+        old = baseline
+        for key in path:
+            old = old.get(key, {}) if isinstance(old, dict) else {}
+        if not isinstance(old, (int, float)) or not old:
+            return ""
+        change = (value - old) / old
+        worse = change > 0.05 if lower_is_better else change < -0.05
+        return f"  ({change:+.1%}{' REGRESSION' if worse else ''})"
+
+    print(f"\nCases: {summary['cases']}  errors: {summary['errors']}  concurrency: {summary['concurrency']}")
+    print("\nAccuracy")
+    for source, acc in summary["accuracy"].items():
+        if source == "rejected_repeated":
+            print(f"  feedback rejected code repeated: {acc['rate']:.1%} of {acc['n']}")
+            continue
+        print(f"  {source:9} n={acc['n']:<4} heading {acc['heading']:.1%}"
+              f"{delta(['accuracy', source, 'heading'], acc['heading'], False)}"
+              f"  subheading {acc['subheading']:.1%}"
+              f"{delta(['accuracy', source, 'subheading'], acc['subheading'], False)}")
+    print("\nLatency (ms)")
+    for stage, pct in summary["latency_ms"].items():
+        print(f"  {stage:15} p50 {pct['p50']:8.1f}  p95 {pct['p95']:8.1f}  p99 {pct['p99']:8.1f}"
+              f"{delta(['latency_ms', stage, 'p95'], pct['p95'])}")
+    print("\nTokens per request")
+    for stage, tokens in summary["tokens_per_request"].items():
+        print(f"  {stage:15} {tokens:8.1f}{delta(['tokens_per_request', stage], tokens)}")
+    print(f"\nThroughput: {summary['throughput_rps']:.2f} req/s"
+          f"{delta(['throughput_rps'], summary['throughput_rps'], False)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline accuracy and latency benchmark for classify_product()")
+    parser.add_argument("--golden", default=GOLDEN_FILE)
+    parser.add_argument("--feedback", default=FEEDBACK_DB, help="feedback database, or a feedback.csv export")
+    parser.add_argument("--limit", type=int, default=0, help="only run the first N cases")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the case list N times")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--stubs", action="store_true", help="run against local stub services")
+    parser.add_argument("--rulings", help="rulings JSON to seed the stub index (default: synthesized from the labels)")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="stub ms per embeddings call")
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="stub ms per chat call")
+    parser.add_argument("--query-latency", type=float, default=0.0, help="stub ms per index query")
+    parser.add_argument("--jitter", type=float, default=0.0, help="stub uniform random ms on top")
+    parser.add_argument("--save", help="write the summary JSON here")
+    parser.add_argument("--compare", help="summary JSON from an earlier run to diff against")
+    parser.add_argument("--tune-routing", action="store_true",
+                        help="run both model tiers on every case and search router thresholds")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.0,
+                        help="accuracy the router may give up against large-model-only when tuning")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    cases = load_golden(args.golden) + load_feedback(args.feedback)
+    if args.limit:
+        cases = cases[:args.limit]
+    if not cases:
+        print("No labeled cases found.")
+        return
+
+    services = None
+    if args.stubs:
+        from stub_services import StubServices
+        services = StubServices(args.embed_latency, args.chat_latency, args.query_latency, args.jitter)
+        os.environ.update(services.env())
+        if args.rulings:
+            with open(args.rulings) as f:
+                rulings = json.load(f)
+        else:
+            rulings = synthetic_rulings(cases)
+        print(f"Seeded stub index with {seed_stub_index(services, rulings):,} vectors")
+
+    cases = cases * args.repeat
+
+    # Imported late so the clients pick up the stub endpoints
+    import core
+    router.SHADOW = args.tune_routing
+
+    print(f"Running {len(cases)} cases at concurrency {args.concurrency}...")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        records = list(pool.map(lambda c: run_case(core, c), cases))
+    wall = time.perf_counter() - start
+
+    if services:
+        services.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    summary = summarize(records, wall, args.concurrency)
+    print_summary(summary, baseline)
+    if args.tune_routing:
+        summary["routing"] = tune_routing(records, args.max_accuracy_drop)
+    for r in records:
+        if r["error"]:
+            print(f"  error: {r['case']['description'][:60]}: {r['error'][:120]}")
+            break
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Saved summary to {args.save}")
+
+if __name__ == "__main__":
+    main()
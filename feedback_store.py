@@ -0,0 +1,250 @@
+import argparse
+import atexit
+import csv
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from hts import extract_hts_code, normalize_hts
+
+FEEDBACK_DB = os.getenv("FEEDBACK_DB", "feedback.db")
+FEEDBACK_CSV = "feedback.csv"
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 1.0
+CSV_FIELDS = ["timestamp", "description", "country", "classification", "was_correct"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    description TEXT NOT NULL,
+    description_key TEXT NOT NULL,
+    country TEXT NOT NULL,
+    classification TEXT NOT NULL,
+    hts_code TEXT NOT NULL,
+    was_correct INTEGER NOT NULL,
+    ruling_ids TEXT NOT NULL DEFAULT '[]',
+    timings TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_timestamp ON feedback (timestamp);
+CREATE INDEX IF NOT EXISTS idx_feedback_hts_code ON feedback (hts_code);
+CREATE INDEX IF NOT EXISTS idx_feedback_key ON feedback (description_key, country, timestamp);
+"""
+
+INSERT = """INSERT INTO feedback (timestamp, description, description_key, country, classification,
+    hts_code, was_correct, ruling_ids, timings) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+def description_key(description):
+    # Case and whitespace differences shouldn't split the history of one product
+    return re.sub(r"\s+", " ", description.strip().lower())
+
+def connect(path, readonly=False):
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class FeedbackReader:
+    # Read side only: no writer thread, and the database is opened read-only
+    # so tools like the evaluator can't change or create it
+
+    def __init__(self, path=FEEDBACK_DB):
+        self.path = path
+        self.local = threading.local()
+
+    def _reader(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = connect(self.path, readonly=True)
+        return conn
+
+    def query(self, since=None, until=None, hts_code=None, was_correct=None, limit=None):
+        clauses, params = [], []
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if hts_code:
+            # Prefix match so a heading or subheading finds every code under it
+            prefix = normalize_hts(hts_code)
+            clauses.append("hts_code >= ? AND hts_code < ?")
+            params.extend([prefix, prefix + ":"])
+        if was_correct is not None:
+            clauses.append("was_correct = ?")
+            params.append(1 if was_correct else 0)
+        sql = "SELECT * FROM feedback"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [self._row(r) for r in self._reader().execute(sql, params)]
+
+    def lookup_confirmed(self, description, country):
+        # Latest classification a user confirmed for this product and origin
+        row = self._reader().execute(
+            "SELECT * FROM feedback WHERE description_key = ? AND country = ? AND was_correct = 1 "
+            "ORDER BY timestamp DESC LIMIT 1",
+            (description_key(description), country)
+        ).fetchone()
+        return self._row(row) if row else None
+
+    def _row(self, row):
+        record = dict(row)
+        record["was_correct"] = bool(record["was_correct"])
+        record["ruling_ids"] = json.loads(record["ruling_ids"])
+        record["timings"] = json.loads(record["timings"])
+        return record
+
+    def export_csv(self, path=FEEDBACK_CSV):
+        rows = self.query()
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for r in rows:
+                writer.writerow({
+                    "timestamp": r["timestamp"],
+                    "description": r["description"],
+                    "country": r["country"],
+                    "classification": r["classification"][:200],
+                    "was_correct": r["was_correct"]
+                })
+        return len(rows)
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+class FeedbackStore(FeedbackReader):
+    # Writes are queued from the request thread and committed in batches by
+    # one writer thread; readers get their own connections, which WAL lets
+    # run alongside the writer
+
+    def __init__(self, path=FEEDBACK_DB, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        super().__init__(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        conn = connect(path)
+        conn.executescript(SCHEMA)
+        conn.close()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def record(self, description, country, classification, was_correct, ruling_ids=None, timings=None):
+        self.queue.put((
+            datetime.now().isoformat(),
+            description,
+            description_key(description),
+            country,
+            classification,
+            extract_hts_code(classification),
+            1 if was_correct else 0,
+            json.dumps(ruling_ids or []),
+            json.dumps(timings or {})
+        ))
+
+    def _write_loop(self):
+        conn = connect(self.path)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            batch = [item]
+            stop = False
+            # Give concurrent clicks a moment to pile up into one transaction
+            try:
+                while len(batch) < self.batch_size:
+                    item = self.queue.get(timeout=self.flush_interval if len(batch) == 1 else 0)
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            try:
+                with conn:
+                    conn.executemany(INSERT, batch)
+            except sqlite3.Error as e:
+                print(f"Feedback write error ({len(batch)} rows): {e}")
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self.queue.task_done()
+            if stop:
+                break
+        conn.close()
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+        super().close()
+
+    def import_csv(self, path=FEEDBACK_CSV):
+        rows = []
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                rows.append((
+                    row["timestamp"],
+                    row["description"],
+                    description_key(row["description"]),
+                    row.get("country", ""),
+                    row.get("classification", ""),
+                    extract_hts_code(row.get("classification", "")),
+                    1 if str(row.get("was_correct")).lower() == "true" else 0,
+                    "[]",
+                    "{}"
+                ))
+        conn = connect(self.path)
+        with conn:
+            conn.executemany(INSERT, rows)
+        conn.close()
+        return len(rows)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    # One store per process, shared by every Streamlit session
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FeedbackStore()
+        return _store
+
+def main():
+    parser = argparse.ArgumentParser(description="Feedback database tools")
+    parser.add_argument("--db", default=FEEDBACK_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="write the feedback.csv shape")
+    exp.add_argument("path", nargs="?", default=FEEDBACK_CSV)
+    imp = sub.add_parser("import", help="load an existing feedback.csv")
+    imp.add_argument("path", nargs="?", default=FEEDBACK_CSV)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        store = FeedbackReader(args.db)
+        print(f"Exported {store.export_csv(args.path):,} rows to {args.path}")
+    else:
+        store = FeedbackStore(args.db)
+        print(f"Imported {store.import_csv(args.path):,} rows from {args.path}")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+import argparse
+import re
+import threading
+import time
+from collections import OrderedDict
+from hts import extract_hts_code, heading, format_hts
+from tracing import span, load_trace_files, TRACE_FILE
+import router
+
+CACHE_SIZE = 2000
+CACHE_TTL = 24 * 3600
+
+# Kept byte-for-byte identical across calls and placed first. At about 300
+# tokens it is below the 1,024-token minimum for automatic prompt caching
+# on its own; the per-product context follows in its own message and the
+# question comes last, so repeated questions about one long classification
+# can share a cacheable prefix. `python followup.py` reports how many
+# prompt tokens were actually served from cache.
+SYSTEM_PROMPT = """You are an expert US customs and trade compliance specialist answering follow-up questions about a product that was just classified.
+
+You may ONLY answer questions in these categories:
+- Required import documentation (CBP Form 3461, commercial invoice, packing list, bill of lading, etc.)
+- Whether the product is likely subject to antidumping (ADD) or countervailing duties (CVD)
+- Whether a customs bond is required
+- ISF (Importer Security Filing) requirements
+- FDA, USDA, or other agency filing requirements for this product type
+- What information must appear on the commercial invoice
+- Country of origin marking requirements (19 CFR Part 134)
+- HTS classification methodology questions
+
+If the question is outside these categories, or involves specific dollar thresholds, rates, or rules that change frequently, respond with:
+This question involves information that changes frequently and is outside the scope of what I can reliably answer. Please verify with a licensed customs broker or at cbp.gov.
+
+Do NOT include quotation marks in your response. Do NOT guess or provide outdated information. It is better to decline than to answer incorrectly.
+Answer concisely and practically. Name specific regulations where relevant."""
+
+DECLINE = ("This question involves information that changes frequently and is outside the scope of what "
+           "I can reliably answer. Please verify with a licensed customs broker or at cbp.gov.")
+
+# Ordered: the first intent whose patterns match wins ties on score
+INTENT_PATTERNS = {
+    "bond": [r"\bbonds?\b", r"\bsurety\b", r"continuous bond", r"single (entry|transaction) bond"],
+    "isf": [r"\bisf\b", r"importer security filing", r"10\s*\+\s*2"],
+    "marking": [r"\bmark(ed|ing|ings)?\b", r"\blabel(l?ed|l?ing|s)?\b", r"made in", r"part 134"],
+    "invoice": [r"\binvoices?\b"],
+    "addcvd": [r"\bcvd\b", r"anti-?dumping", r"countervailing", r"dumping"],
+    "agency": [r"\bfda\b", r"\busda\b", r"\bfcc\b", r"\bepa\b", r"\bcpsc\b", r"\baphis\b",
+               r"\bpga\b", r"partner government", r"other agenc", r"prior notice", r"permits?\b", r"licen[cs]e"],
+    "documents": [r"\bdocuments?\b", r"\bdocumentation\b", r"\bpaperwork\b", r"\bforms?\b",
+                  r"bill of lading", r"packing list", r"\b3461\b", r"\b7501\b"],
+    "out_of_scope": [r"\bduty rate", r"\btariff rate", r"\brates?\b", r"\bhow much\b", r"\bcost\b",
+                     r"\$\s*\d", r"\bthreshold", r"de minimis", r"\bpercent", r"%", r"\bsection 301\b",
+                     r"\bexclusion", r"\brefund", r"\bdrawback"],
+}
+INTENT_REGEXES = {intent: [re.compile(p) for p in patterns] for intent, patterns in INTENT_PATTERNS.items()}
+# "add" is only the antidumping acronym when the user capitalizes it
+ACRONYM_REGEXES = {"addcvd": [re.compile(r"\bAD(D)?\b")]}
+
+# Answers that don't depend on the product; served without a model call
+TEMPLATES = {
+    "bond": """A customs bond (19 CFR Part 113) is required to make a formal entry and is also required to file ISF as the importer of record for ocean shipments. Informal entries can generally be made without one, but whether your shipment qualifies depends on value limits that change, so confirm with your broker.
+
+Options:
+- Single transaction bond: covers one entry; practical for occasional imports.
+- Continuous bond (CBP Form 301): covers all entries at all ports for 12 months; practical if you import regularly.
+
+Bonds are obtained through a CBP-approved surety, usually arranged by your customs broker. Products subject to ADD/CVD or partner agency requirements can require higher bond amounts.""",
+    "isf": """ISF (Importer Security Filing, also called 10+2, 19 CFR Part 149) applies to cargo arriving in the US by ocean vessel. It does not apply to air, truck or rail shipments.
+
+- The ISF importer must submit the 10 importer data elements no later than 24 hours before the cargo is laden on the vessel at the foreign port.
+- Required elements include seller, buyer, importer of record number, consignee number, manufacturer or supplier, ship-to party, country of origin, HTS number (6-digit minimum), container stuffing location and consolidator.
+- The carrier files the additional 2 elements (vessel stow plan and container status messages).
+
+Late, inaccurate or missing filings can result in liquidated damages, and a bond is needed to file. Your broker or freight forwarder can file on your behalf.""",
+    "marking": """Under 19 U.S.C. 1304 and 19 CFR Part 134, every article of foreign origin (or its container, where the article itself is excepted) must be marked with its country of origin in English.
+
+- The marking must be legible, indelible and permanent enough to reach the ultimate purchaser, for example Made in {country_name} or {country_name}.
+- It must be in a conspicuous place where it will be seen with normal handling.
+- Abbreviations are acceptable only if they unmistakably indicate the country name.
+- Some articles are excepted under 19 CFR 134.32/134.33 (J-List), but their outermost container usually still has to be marked.
+
+Improperly marked goods can be assessed marking duties and must be re-marked, exported or destroyed before release.""",
+    "invoice": """Under 19 CFR 141.86, the commercial invoice for each shipment should show:
+
+- Port of entry, and names/addresses of the seller (or shipper) and the buyer (or consignee)
+- A detailed description of the merchandise: trade name, grade, quality, marks and numbers, and the material and use that support the HTS classification{hts_line}
+- Quantities in the weights and measures of the shipping country or the US
+- Purchase price or value of each item, the currency, and the terms of sale (e.g. FOB, CIF)
+- All charges (freight, insurance, commissions, packing, assists) itemized, along with any rebates or discounts
+- Country of origin ({country_name})
+- Time and place of sale, and the name of the manufacturer
+
+The invoice must be in English or accompanied by an accurate English translation.""",
+    "out_of_scope": DECLINE,
+}
+CACHED_INTENTS = {"documents", "addcvd", "agency"}
+
+# Intents that cover several distinct questions; the matched topics are part
+# of the cache key so an FCC answer is never served for an FDA question
+TOPIC_PATTERNS = {
+    "agency": {
+        "fda": r"\bfda\b|prior notice",
+        "usda": r"\busda\b|\baphis\b",
+        "fcc": r"\bfcc\b",
+        "epa": r"\bepa\b",
+        "cpsc": r"\bcpsc\b",
+        "permit": r"permits?\b|licen[cs]e",
+    },
+    "documents": {
+        "bill_of_lading": r"bill of lading",
+        "packing_list": r"packing list",
+        "3461": r"\b3461\b",
+        "7501": r"\b7501\b",
+    },
+}
+TOPIC_REGEXES = {intent: {topic: re.compile(p) for topic, p in topics.items()}
+                 for intent, topics in TOPIC_PATTERNS.items()}
+
+class AnswerCache:
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            answer, stored = entry
+            if time.time() - stored > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return answer
+
+    def put(self, key, answer):
+        with self.lock:
+            self.entries[key] = (answer, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+class FollowupStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"cache": 0, "template": 0, "model": 0}
+        self.model_seconds = 0.0
+        self.served_seconds = 0.0
+
+    def add(self, source, seconds):
+        with self.lock:
+            self.counts[source] += 1
+            if source == "model":
+                self.model_seconds += seconds
+            else:
+                self.served_seconds += seconds
+
+    def summary(self):
+        with self.lock:
+            return summarize(dict(self.counts), self.model_seconds, self.served_seconds)
+
+cache = AnswerCache()
+stats = FollowupStats()
+
+def normalize_question(question):
+    text = question.lower().replace("’", "'")
+    return " ".join(re.sub(r"[^a-z0-9$%+'\-\s]", " ", text).split())
+
+def classify_intent(question):
+    text = normalize_question(question)
+    scores = {}
+    for intent, regexes in INTENT_REGEXES.items():
+        hits = sum(1 for r in regexes if r.search(text))
+        hits += sum(1 for r in ACRONYM_REGEXES.get(intent, []) if r.search(question))
+        if hits:
+            scores[intent] = hits
+    if not scores:
+        return None
+    in_scope = {i: s for i, s in scores.items() if i != "out_of_scope"}
+    if not in_scope:
+        return "out_of_scope"
+    if "out_of_scope" in scores:
+        # Mixed questions need the model to decide what it can answer
+        return None
+    best = max(in_scope.values())
+    winners = [i for i, s in in_scope.items() if s == best]
+    # "What documents does FDA need?" is an agency question, not a paperwork one
+    if len(winners) > 1 and "documents" in winners:
+        winners.remove("documents")
+    return winners[0] if len(winners) == 1 else None
+
+def question_topics(intent, question):
+    text = normalize_question(question)
+    return tuple(topic for topic, r in TOPIC_REGEXES.get(intent, {}).items() if r.search(text))
+
+# CBP requires goods from Hong Kong to be marked with China as the origin
+MARKING_NAMES = {"Hong Kong": "China"}
+# Choices that don't name a single country can't fill the marking template;
+# "Made in European Union" is not an acceptable marking. "Not specified" and
+# an empty origin are sent to the model for marking questions too.
+NOT_A_COUNTRY = {"European Union (EU)", "Other"}
+
+def country_name(country):
+    if not country or country == "Not specified" or country in NOT_A_COUNTRY:
+        return "the country of origin"
+    name = country.split(" (")[0]
+    return MARKING_NAMES.get(name, name)
+
+def template_applies(intent, country):
+    # The marking template needs a real country to show the marking itself
+    if intent == "marking" and (not country or country == "Not specified" or country in NOT_A_COUNTRY):
+        return False
+    return intent in TEMPLATES
+
+def render_template(intent, classification, country):
+    code = extract_hts_code(classification)
+    return TEMPLATES[intent].format(
+        country_name=country_name(country),
+        hts_line=f" (here, HTS {format_hts(code)})" if code else ""
+    )
+
+def build_messages(question, classification, description, country):
+    context = f"""A product was just classified with the following result:
+
+PRODUCT: {description}
+COUNTRY OF ORIGIN: {country}
+CLASSIFICATION RESULT:
+{classification}"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": context},
+        {"role": "user", "content": f"Follow-up question: {question}"},
+    ]
+
+def ask_followup(client, question, classification, description, country):
+    intent = classify_intent(question)
+    key = (intent, question_topics(intent, question), heading(extract_hts_code(classification)), country)
+    start = time.perf_counter()
+    with span("followup", intent=intent or "") as s:
+        if template_applies(intent, country):
+            source = "template"
+            answer = render_template(intent, classification, country)
+        else:
+            cacheable = intent in CACHED_INTENTS and key[2]
+            answer = cache.get(key) if cacheable else None
+            source = "cache"
+            if answer is None:
+                source = "model"
+                answer = router.complete(client, build_messages(question, classification, description, country),
+                                         max_tokens=600, stage="followup")
+                if cacheable:
+                    cache.put(key, answer)
+        s.set(source=source)
+    stats.add(source, time.perf_counter() - start)
+    return answer
+
+def summarize(counts, model_seconds, served_seconds):
+    total = sum(counts.values())
+    served = total - counts["model"]
+    avg_model = model_seconds / counts["model"] if counts["model"] else 0.0
+    return {
+        "questions": total,
+        "counts": counts,
+        "hit_rate": served / total if total else 0.0,
+        "avg_model_ms": avg_model * 1000,
+        # Each answer served locally would otherwise have cost an average model call
+        "latency_saved_s": max(0.0, served * avg_model - served_seconds),
+    }
+
+def report(path):
+    counts = {"cache": 0, "template": 0, "model": 0}
+    model_ms = served_ms = 0.0
+    intents = {}
+    prompt_tokens = cached_tokens = 0
+    for r in load_trace_files(path):
+        if r["name"] in ("followup.small", "followup.large"):
+            prompt_tokens += r.get("tokens_in", 0)
+            cached_tokens += r["attrs"].get("cached_tokens", 0)
+        if r["name"] != "followup":
+            continue
+        source = r["attrs"].get("source", "model")
+        counts[source] = counts.get(source, 0) + 1
+        if source == "model":
+            model_ms += r["duration_ms"]
+        else:
+            served_ms += r["duration_ms"]
+        intent = r["attrs"].get("intent") or "(none)"
+        intents.setdefault(intent, {"cache": 0, "template": 0, "model": 0})[source] += 1
+    summary = summarize(counts, model_ms / 1000, served_ms / 1000)
+    if not summary["questions"]:
+        print(f"No follow-up spans found in {path}")
+        return
+    print(f"Follow-up questions: {summary['questions']:,}")
+    print(f"  served from templates: {counts['template']:,}")
+    print(f"  served from cache:     {counts['cache']:,}")
+    print(f"  model calls:           {counts['model']:,}")
+    print(f"Hit rate: {summary['hit_rate']:.1%}")
+    print(f"Average model call: {summary['avg_model_ms']:.0f} ms")
+    print(f"Latency saved: {summary['latency_saved_s']:.1f} s")
+    if prompt_tokens:
+        print(f"Provider prompt cache: {cached_tokens:,} of {prompt_tokens:,} prompt tokens "
+              f"({cached_tokens / prompt_tokens:.1%})")
+    print("\nBy intent (template / cache / model):")
+    for intent, c in sorted(intents.items()):
+        print(f"  {intent:14} {c['template']:>6} {c['cache']:>6} {c['model']:>6}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow-up cache hit rate and latency saved, from trace files")
+    parser.add_argument("--file", default=TRACE_FILE or "traces.jsonl")
+    args = parser.parse_args()
+    report(args.file)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import re
+
+# 8518.30.2000, 8518.30.20.00, 8518.30, or a bare 10-digit 8518302000
+HTS_PATTERN = re.compile(r"\b(\d{4})\.(\d{2})(?:\.(\d{2})(?:\.?(\d{2}))?)?\b|\b(\d{10})\b")
+
+def extract_hts_code(text):
+    if not text:
+        return ""
+    match = HTS_PATTERN.search(text)
+    if not match:
+        return ""
+    if match.group(5):
+        return match.group(5)
+    return "".join(g for g in match.groups()[:4] if g)
+
+def extract_all_hts_codes(text):
+    codes = []
+    for match in HTS_PATTERN.finditer(text or ""):
+        if match.group(5):
+            codes.append(match.group(5))
+        else:
+            codes.append("".join(g for g in match.groups()[:4] if g))
+    return codes
+
+def normalize_hts(code):
+    return re.sub(r"\D", "", code or "")
+
+def heading(code):
+    return normalize_hts(code)[:4]
+
+def subheading(code):
+    return normalize_hts(code)[:6]
+
+def format_hts(code):
+    digits = normalize_hts(code)
+    parts = [digits[:4], digits[4:6], digits[6:10]]
+    return ".".join(p for p in parts if p)
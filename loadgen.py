@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import aiohttp
+from evaluate import load_golden, synthetic_rulings, seed_stub_index, GOLDEN_FILE
+from tracing import percentile
+
+# Load generator for api.py. With --stubs it starts the local API stand-ins
+# and an api.py process pointed at them, so the service can be load tested
+# without touching the paid APIs.
+
+def make_requests(cases, count, duplicate_ratio, batch_size, followup_ratio):
+    # duplicate_ratio of requests repeat a recent description, which is what
+    # exercises request coalescing and the result cache
+    requests = []
+    recent = []
+    for n in range(count):
+        if recent and random.random() < duplicate_ratio:
+            case = random.choice(recent[-8:])
+        else:
+            case = dict(random.choice(cases))
+            # Make the description unique so it misses the cache
+            case["description"] = f"{case['description']} (sample {n})"
+            recent.append(case)
+        if random.random() < followup_ratio:
+            requests.append(("/followup", {
+                "question": random.choice(["What import documents do I need?", "Do I need a customs bond?",
+                                           "Is this subject to ADD/CVD?", "Why this heading?"]),
+                "classification": f"1. HTS Code: {case['hts_code']}",
+                "description": case["description"],
+                "country": case.get("country", "Not specified"),
+            }))
+        elif batch_size > 1:
+            items = [{"description": c["description"], "country": c.get("country")}
+                     for c in [case] + random.sample(cases, min(batch_size - 1, len(cases)))]
+            requests.append(("/classify/batch", {"items": items}))
+        else:
+            requests.append(("/classify", {"description": case["description"], "country": case.get("country")}))
+    return requests
+
+async def run_load(url, requests, concurrency, rate, api_key):
+    results = []
+    queue = asyncio.Queue()
+    for r in requests:
+        queue.put_nowait(r)
+    headers = {"X-API-Key": api_key} if api_key else {}
+    interval = 1.0 / rate if rate else 0.0
+    next_start = [time.perf_counter()]
+
+    async def worker(session):
+        while True:
+            try:
+                path, body = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if interval:
+                # Open-loop pacing: requests start on schedule regardless of
+                # how slow earlier ones are
+                slot = next_start[0]
+                next_start[0] += interval
+                await asyncio.sleep(max(0.0, slot - time.perf_counter()))
+            start = time.perf_counter()
+            try:
+                async with session.post(url + path, json=body, headers=headers) as resp:
+                    payload = await resp.json(content_type=None)
+                    source = payload.get("source", "") if isinstance(payload, dict) else ""
+                    results.append((path, resp.status, time.perf_counter() - start, source))
+            except Exception as e:
+                results.append((path, type(e).__name__, time.perf_counter() - start, ""))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return results, wall
+
+def print_report(results, wall, concurrency):
+    print(f"\n{len(results):,} requests in {wall:.1f}s at concurrency {concurrency}: "
+          f"{len(results) / wall:.1f} req/s")
+    print(f"{'endpoint':18}{'count':>7}{'ok':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for path in sorted(set(r[0] for r in results)):
+        rs = [r for r in results if r[0] == path]
+        ms = [r[2] * 1000 for r in rs if r[1] == 200]
+        print(f"{path:18}{len(rs):>7}{len(ms):>7}{percentile(ms, 50):>9.1f}"
+              f"{percentile(ms, 95):>9.1f}{percentile(ms, 99):>9.1f}")
+    statuses = {}
+    sources = {}
+    for r in results:
+        statuses[r[1]] = statuses.get(r[1], 0) + 1
+        if r[3]:
+            sources[r[3]] = sources.get(r[3], 0) + 1
+    print("Status: " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items(), key=str)))
+    if sources:
+        print("Classify served by: " + ", ".join(f"{k}={v}" for k, v in sorted(sources.items())))
+
+def start_stub_stack(args, cases):
+    from stub_services import StubServices
+    services = StubServices(args.embed_latency, args.chat_latency, args.query_latency, args.jitter)
+    seed_stub_index(services, synthetic_rulings(cases))
+    env = {**os.environ, **services.env(), "API_PORT": str(args.port), "TRACE_FILE": args.trace_file}
+    server = subprocess.Popen([sys.executable, "api.py", "--port", str(args.port)], env=env,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    return services, server
+
+async def wait_healthy(url, timeout=30):
+    deadline = time.time() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.time() < deadline:
+            try:
+                async with session.get(url + "/healthz") as resp:
+                    if resp.status == 200:
+                        return await resp.json()
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become healthy")
+
+async def fetch_health(url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url + "/healthz") as resp:
+            return await resp.json()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the classification API")
+    parser.add_argument("--url", default="", help="API base URL (default: local api.py started with --stubs)")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rate", type=float, default=0.0, help="target requests/s (default: closed loop)")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3)
+    parser.add_argument("--followup-ratio", type=float, default=0.1)
+    parser.add_argument("--batch-size", type=int, default=1, help="send /classify/batch with N items")
+    parser.add_argument("--golden", default=GOLDEN_FILE)
+    parser.add_argument("--api-key", default=os.getenv("API_KEY", ""))
+    parser.add_argument("--stubs", action="store_true", help="start stub services and a local api.py")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--embed-latency", type=float, default=20.0)
+    parser.add_argument("--chat-latency", type=float, default=800.0)
+    parser.add_argument("--query-latency", type=float, default=30.0)
+    parser.add_argument("--jitter", type=float, default=50.0)
+    parser.add_argument("--trace-file", default="loadgen_traces.jsonl")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    cases = load_golden(args.golden)
+    if not cases:
+        print(f"No cases in {args.golden}")
+        return
+    requests = make_requests(cases, args.requests, args.duplicate_ratio, args.batch_size, args.followup_ratio)
+
+    services = server = None
+    url = args.url.rstrip("/")
+    if args.stubs:
+        services, server = start_stub_stack(args, cases)
+        url = f"http://127.0.0.1:{args.port}"
+    elif not url:
+        parser.error("--url is required without --stubs")
+
+    try:
+        asyncio.run(wait_healthy(url))
+        results, wall = asyncio.run(run_load(url, requests, args.concurrency, args.rate, args.api_key))
+        print_report(results, wall, args.concurrency)
+        health = asyncio.run(fetch_health(url))
+        print("Server counters: " + json.dumps(health.get("classify", {})))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        if services:
+            services.shutdown()
+    if args.stubs:
+        print(f"Server spans written to {args.trace_file}; summarize with: python tracing.py report --file {args.trace_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import re
+from hts import extract_hts_code, extract_all_hts_codes, heading
+from tracing import span, load_trace_files, percentile, TRACE_FILE
+
+SMALL_MODEL = os.getenv("SMALL_MODEL", "gpt-4o-mini")
+LARGE_MODEL = os.getenv("LARGE_MODEL", "gpt-4o")
+
+# Tuned with `python evaluate.py --tune-routing`
+MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.8"))
+MIN_AGREEMENT = float(os.getenv("ROUTER_MIN_AGREEMENT", "0.6"))
+MIN_SIMILARITY = float(os.getenv("ROUTER_MIN_SIMILARITY", "0.0"))
+
+# Run both tiers on every request so the eval can replay any threshold
+SHADOW = os.getenv("ROUTER_SHADOW", "") == "1"
+
+CLASSIFY_INSTRUCTION = """
+
+After your answer, add one final line containing only this JSON object and nothing else:
+{"hts_code": "<the HTS code you chose>", "confidence": <0.0 to 1.0, how sure you are the code is correct>}"""
+
+FOLLOWUP_INSTRUCTION = """After your answer, add one final line containing only this JSON object and nothing else:
+{"confidence": <0.0 to 1.0, how sure you are the answer is correct and in scope>}"""
+
+CONFIDENCE_LINE = re.compile(r"\n?[`\s]*(?:json)?\s*(\{[^{}]*\"confidence\"[^{}]*\})[`\s]*$", re.IGNORECASE)
+CONFIDENCE_WORDS = {"high": 0.9, "medium": 0.6, "low": 0.3}
+CONFIDENCE_WORD = re.compile(r"confidence(?: level)?\W+(high|medium|low)", re.IGNORECASE)
+
+def thresholds():
+    return {"min_confidence": MIN_CONFIDENCE, "min_agreement": MIN_AGREEMENT, "min_similarity": MIN_SIMILARITY}
+
+def parse_confidence(text):
+    # Returns the answer without the JSON line, plus what the line said
+    match = CONFIDENCE_LINE.search(text)
+    data = {}
+    if match:
+        try:
+            data = json.loads(match.group(1))
+        except ValueError:
+            data = {}
+        text = text[:match.start()].rstrip()
+    confidence = data.get("confidence")
+    if not isinstance(confidence, (int, float)):
+        # Fall back to the High/Medium/Low the classification prompt asks for
+        word = CONFIDENCE_WORD.search(text)
+        confidence = CONFIDENCE_WORDS[word.group(1).lower()] if word else 0.0
+    return text, {"hts_code": data.get("hts_code") or extract_hts_code(text), "confidence": float(confidence)}
+
+def ruling_agreement(similar_rulings):
+    # Similarity-weighted share of the top heading among rulings that cite
+    # a code; None when none do, which we treat as no disagreement
+    weights = {}
+    for r in similar_rulings or []:
+        codes = extract_all_hts_codes(r.get("text", ""))
+        if codes:
+            h = heading(codes[0])
+            weights[h] = weights.get(h, 0.0) + max(r.get("similarity", 0.0), 0.0)
+    if not weights:
+        return None, ""
+    top = max(weights, key=weights.get)
+    total = sum(weights.values())
+    return (weights[top] / total if total else 0.0), top
+
+def decide(limits, agreement, top_heading, top_similarity, small):
+    # Shared with the eval tuner so replayed decisions match live ones
+    if agreement is not None and agreement < limits["min_agreement"]:
+        return "large", "rulings_disagree"
+    if top_similarity is not None and top_similarity < limits["min_similarity"]:
+        return "large", "low_similarity"
+    if small is None:
+        return "small", "pending"
+    if small["confidence"] < limits["min_confidence"]:
+        return "large", "low_confidence"
+    if agreement is not None and top_heading and small["hts_code"] and heading(small["hts_code"]) != top_heading:
+        return "large", "contradicts_rulings"
+    return "small", "confident"
+
+def call(client, stage, tier, model, messages, max_tokens):
+    with span(f"{stage}.{tier}", model=model, tier=tier) as s:
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens
+        )
+        s.record_usage(response)
+        details = getattr(response.usage, "prompt_tokens_details", None)
+        s.set(cached_tokens=getattr(details, "cached_tokens", 0) or 0)
+        content = response.choices[0].message.content or ""
+        s.add_bytes(bytes_out=len(json.dumps(messages).encode()), bytes_in=len(content.encode()))
+    return content
+
+def with_instruction(messages, stage):
+    messages = [dict(m) for m in messages]
+    if stage == "followup":
+        # Separate trailing message keeps the cached system prefix intact
+        messages.append({"role": "system", "content": FOLLOWUP_INSTRUCTION})
+        return messages
+    last = messages[-1]
+    if isinstance(last["content"], str):
+        last["content"] = last["content"] + CLASSIFY_INSTRUCTION
+    else:
+        last["content"] = [dict(c) for c in last["content"]]
+        text = next(c for c in last["content"] if c.get("type") == "text")
+        text["text"] = text["text"] + CLASSIFY_INSTRUCTION
+    return messages
+
+def complete(client, messages, max_tokens, stage="classify", similar_rulings=None, limits=None):
+    # Try the small model first and escalate to the large one when it is
+    # unsure or the retrieved rulings don't support an easy answer
+    limits = limits or thresholds()
+    messages = with_instruction(messages, stage)
+    agreement, top_heading = ruling_agreement(similar_rulings) if stage == "classify" else (None, "")
+    top_similarity = max((r.get("similarity", 0.0) for r in similar_rulings), default=None) if similar_rulings else None
+
+    with span(f"{stage}.chat") as route:
+        route.set(agreement=agreement, top_heading=top_heading, top_similarity=top_similarity, **limits)
+        small = None
+        tier, reason = decide(limits, agreement, top_heading, top_similarity, None)
+        if tier == "small" or SHADOW:
+            try:
+                small_text, small = parse_confidence(call(client, stage, "small", SMALL_MODEL, messages, max_tokens))
+            except Exception as e:
+                # A rate limit or outage on the small model shouldn't fail a
+                # request the large model can still answer
+                route.set(small_error=type(e).__name__)
+                if tier == "small":
+                    tier, reason = "large", "small_error"
+            else:
+                route.set(small_code=small["hts_code"], small_confidence=small["confidence"])
+                if tier == "small":
+                    tier, reason = decide(limits, agreement, top_heading, top_similarity, small)
+        if tier == "large" or SHADOW:
+            large_text, large = parse_confidence(call(client, stage, "large", LARGE_MODEL, messages, max_tokens))
+            route.set(large_code=large["hts_code"], large_confidence=large["confidence"])
+        route.set(tier=tier, reason=reason)
+
+    return small_text if tier == "small" else large_text
+
+def report(path):
+    routes = {}
+    tiers = {}
+    for r in load_trace_files(path):
+        name = r["name"]
+        stage, _, suffix = name.rpartition(".")
+        if suffix == "chat" and "tier" in r["attrs"]:
+            routes.setdefault(stage, []).append(r["attrs"])
+        elif suffix in ("small", "large"):
+            tiers.setdefault(name, []).append(r)
+    if not routes:
+        print(f"No routing decisions found in {path}")
+        return
+    for stage, decisions in sorted(routes.items()):
+        escalated = sum(1 for d in decisions if d["tier"] == "large")
+        print(f"{stage}: {len(decisions):,} requests, {escalated / len(decisions):.1%} escalated to {LARGE_MODEL}")
+        reasons = {}
+        for d in decisions:
+            reasons[d["reason"]] = reasons.get(d["reason"], 0) + 1
+        for reason, count in sorted(reasons.items(), key=lambda i: -i[1]):
+            print(f"  {reason:22} {count:>7,}")
+    print(f"\n{'tier':20}{'calls':>8}{'p50 ms':>10}{'p95 ms':>10}{'cost $':>10}{'$/call':>10}")
+    for name, rs in sorted(tiers.items()):
+        ms = [r["duration_ms"] for r in rs]
+        cost = sum(r.get("cost_usd", 0.0) for r in rs)
+        print(f"{name:20}{len(rs):>8,}{percentile(ms, 50):>10.1f}{percentile(ms, 95):>10.1f}"
+              f"{cost:>10.4f}{cost / len(rs):>10.5f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Routing decisions and per-tier latency and cost, from trace files")
+    parser.add_argument("--file", default=TRACE_FILE or "traces.jsonl")
+    args = parser.parse_args()
+    report(args.file)
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,17 @@ import json
 import os
 import time
 from datetime import datetime
+from tracing import span
+from corpus import write_corpus, CORPUS_FILE
 
 BASE_URL = "https://rulings.cbp.gov/ruling/"
 OUTPUT_FILE = "C:/customs_ai2/rulings.json"
 PROGRESS_FILE = "C:/customs_ai2/scraper_progress.json"
 SAVE_EVERY = 100
 DELAY = 0.3
+# Full ruling text is chunked at upload time, so keep far more than one
+# embedding window; this only guards against pathological pages
+MAX_TEXT = 30000
 
 # All ruling ranges to cover
 # NY rulings: N000001 - N350000
@@ -50,24 +55,29 @@ def load_existing_rulings():
     return []
 
 def save_rulings(rulings):
-    with open(OUTPUT_FILE, "w") as f:
-        json.dump(rulings, f)
+    with span("scraper.save", rulings=len(rulings)):
+        with open(OUTPUT_FILE, "w") as f:
+            json.dump(rulings, f)
 
 def fetch_ruling(ruling_number):
     try:
         url = f"{BASE_URL}{ruling_number}"
         headers = {"User-Agent": "Mozilla/5.0 (research tool)"}
-        response = requests.get(url, headers=headers, timeout=15)
+        with span("scraper.fetch", ruling=ruling_number) as s:
+            response = requests.get(url, headers=headers, timeout=15)
+            s.set(status=response.status_code)
+            s.add_bytes(bytes_in=len(response.content))
         if response.status_code != 200:
             return None
-        soup = BeautifulSoup(response.text, "html.parser")
-        content = soup.get_text(separator=" ", strip=True)
+        with span("scraper.parse", ruling=ruling_number):
+            soup = BeautifulSoup(response.text, "html.parser")
+            content = soup.get_text(separator=" ", strip=True)
         if len(content) < 200:
             return None
         return {
             "ruling_number": ruling_number,
             "url": url,
-            "text": content[:3000]
+            "text": content[:MAX_TEXT]
         }
     except Exception:
         return None
@@ -114,6 +124,16 @@ def main():
         save_rulings(existing_rulings)
         save_progress(total, scraped_count)
 
+    # The JSON stays the scraper's working file; readers use the corpus
+    try:
+        with span("scraper.corpus"):
+            records, blocks = write_corpus(existing_rulings, CORPUS_FILE)
+        print(f"Wrote {records:,} rulings to {CORPUS_FILE} in {blocks:,} blocks")
+    except OSError as e:
+        # rulings.json is already saved, so the scrape itself isn't lost
+        print(f"Could not write {CORPUS_FILE}: {e}")
+        print(f"Rebuild it from {OUTPUT_FILE} with: python corpus.py build")
+
     print(f"\nDone! Total rulings collected: {scraped_count:,}")
 
 if __name__ == "__main__":
@@ -0,0 +1,304 @@
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from hts import extract_all_hts_codes, format_hts
+
+# Local stand-ins for the OpenAI embeddings/chat API and the Pinecone data
+# plane. They speak just enough of each wire format for the real clients,
+# so the code under test runs unmodified with OPENAI_BASE_URL and
+# PINECONE_HOST pointed here. OpenAI and the index get separate ports, and
+# embeddings, chat and index calls each get their own injected latency.
+
+EMBEDDING_DIM = 1536
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def count_tokens(text):
+    # Close enough to tiktoken for English prose to make cost numbers useful
+    return max(1, math.ceil(len(text) / 4))
+
+def _bucket(feature):
+    digest = hashlib.md5(feature.encode()).digest()
+    dim = int.from_bytes(digest[:4], "little") % EMBEDDING_DIM
+    sign = 1.0 if digest[4] & 1 else -1.0
+    return dim, sign
+
+def stub_embedding(text):
+    # Hashed bag of words and bigrams: deterministic, and similar texts get
+    # similar vectors, so retrieval against the stub index still means something
+    words = TOKEN_PATTERN.findall(text.lower())
+    features = Counter(words)
+    features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    vector = [0.0] * EMBEDDING_DIM
+    for feature, count in features.items():
+        dim, sign = _bucket(feature)
+        vector[dim] += sign * count
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+def stub_answer(prompt, model=""):
+    wants_json = '"confidence"' in prompt
+    if "Follow-up question:" in prompt:
+        answer = ("Stub follow-up answer. See 19 CFR Part 141 for entry requirements "
+                  "and confirm the details with a licensed customs broker.")
+        return answer + ('\n{"confidence": 0.8}' if wants_json else "")
+    context = prompt.split("PRODUCT", 1)[0]
+    codes = extract_all_hts_codes(context)
+    if not codes:
+        return ("1. HTS Code: unable to determine\n2. Confidence Level: Low\n"
+                "3. Reasoning: none of the supplied rulings cite a tariff number."
+                + ('\n{"hts_code": "", "confidence": 0.1}' if wants_json else ""))
+    if "mini" in model:
+        # The small tier goes with the majority of the cited codes, which
+        # differs from the large tier exactly when the rulings disagree
+        code = Counter(codes).most_common(1)[0][0]
+    else:
+        # The large tier answers with the code the best-matching ruling
+        # cites, the way a model that trusts its retrieval would
+        code = codes[0]
+    agree = sum(1 for c in codes if c[:4] == code[:4]) / len(codes)
+    confidence = "High" if agree >= 0.75 else "Medium" if agree >= 0.4 else "Low"
+    code = format_hts(code)
+    answer = (f"1. HTS Code: {code}\n2. Confidence Level: {confidence}\n"
+              f"3. Reasoning: the most similar rulings classify comparable products under {code}.")
+    if wants_json:
+        answer += "\n" + json.dumps({"hts_code": code, "confidence": round(agree, 2)})
+    return answer
+
+def message_text(messages):
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(c.get("text", "") for c in content if c.get("type") == "text")
+    return "\n".join(parts)
+
+class StubIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.namespaces = {}
+
+    def upsert(self, vectors, namespace=""):
+        with self.lock:
+            ns = self.namespaces.setdefault(namespace, {})
+            for v in vectors:
+                # Keep only non-zero dims; stub embeddings are sparse
+                sparse = {i: x for i, x in enumerate(v["values"]) if x}
+                ns[v["id"]] = (sparse, v.get("metadata", {}))
+        return len(vectors)
+
+    def delete(self, ids=None, delete_all=False, namespace=""):
+        with self.lock:
+            if delete_all:
+                self.namespaces.pop(namespace, None)
+                return
+            ns = self.namespaces.get(namespace, {})
+            for i in ids or []:
+                ns.pop(i, None)
+
+    def query(self, vector, top_k, namespace="", include_metadata=False):
+        query = {i: x for i, x in enumerate(vector) if x}
+        with self.lock:
+            items = list(self.namespaces.get(namespace, {}).items())
+        scored = []
+        for vid, (sparse, metadata) in items:
+            small, large = (query, sparse) if len(query) < len(sparse) else (sparse, query)
+            score = sum(x * large.get(i, 0.0) for i, x in small.items())
+            scored.append((score, vid, metadata))
+        scored.sort(key=lambda s: s[0], reverse=True)
+        return [{
+            "id": vid,
+            "score": score,
+            "values": [],
+            **({"metadata": metadata} if include_metadata else {})
+        } for score, vid, metadata in scored[:top_k]]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "namespaces": {ns: {"vectorCount": len(v)} for ns, v in self.namespaces.items()},
+                "dimension": EMBEDDING_DIM,
+                "indexFullness": 0.0,
+                "totalVectorCount": sum(len(v) for v in self.namespaces.values())
+            }
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _dispatch(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        route = self.server.routes.get((self.command, path))
+        if route is None:
+            self._send(404, {"error": {"message": f"no stub for {self.command} {path}"}})
+            return
+        body = self._read() if self.command == "POST" else {}
+        self.server.sleep(path)
+        self._send(200, route(body))
+
+    do_GET = _dispatch
+    do_POST = _dispatch
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, routes, latency_ms=None, jitter_ms=0.0):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.routes = routes
+        self.latency_ms = latency_ms or {}
+        self.jitter_ms = jitter_ms
+        self.requests = Counter()
+        self.count_lock = threading.Lock()
+
+    def sleep(self, path):
+        with self.count_lock:
+            self.requests[path] += 1
+        delay = self.latency_ms.get(path, 0.0) + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+def embeddings_routes():
+    def create(body):
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for n, text in enumerate(inputs):
+            vector = stub_embedding(text)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode()
+            data.append({"object": "embedding", "index": n, "embedding": vector})
+        tokens = sum(count_tokens(t) for t in inputs)
+        return {"object": "list", "data": data, "model": body.get("model", ""),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+    return {("POST", "/v1/embeddings"): create}
+
+def chat_routes():
+    def create(body):
+        prompt = message_text(body.get("messages", []))
+        answer = stub_answer(prompt, body.get("model", ""))
+        prompt_tokens = count_tokens(prompt)
+        completion_tokens = count_tokens(answer)
+        return {
+            "id": f"chatcmpl-stub-{random.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": answer}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }
+    return {("POST", "/v1/chat/completions"): create}
+
+def index_routes(stub_index):
+    def query(body):
+        matches = stub_index.query(body["vector"], body.get("topK", 10),
+                                   body.get("namespace", ""), body.get("includeMetadata", False))
+        return {"matches": matches, "namespace": body.get("namespace", ""),
+                "usage": {"readUnits": 5}}
+
+    def upsert(body):
+        return {"upsertedCount": stub_index.upsert(body["vectors"], body.get("namespace", ""))}
+
+    def delete(body):
+        stub_index.delete(body.get("ids"), body.get("deleteAll", False), body.get("namespace", ""))
+        return {}
+
+    def stats(body):
+        return stub_index.stats()
+
+    return {
+        ("POST", "/query"): query,
+        ("POST", "/vectors/upsert"): upsert,
+        ("POST", "/vectors/delete"): delete,
+        ("GET", "/describe_index_stats"): stats,
+        ("POST", "/describe_index_stats"): stats,
+    }
+
+class StubServices:
+    def __init__(self, embed_ms=0.0, chat_ms=0.0, query_ms=0.0, jitter_ms=0.0):
+        self.index = StubIndex()
+        self.openai = StubServer(
+            {**embeddings_routes(), **chat_routes()},
+            {"/v1/embeddings": embed_ms, "/v1/chat/completions": chat_ms},
+            jitter_ms
+        ).start()
+        self.vector_index = StubServer(index_routes(self.index), {"/query": query_ms}, jitter_ms).start()
+
+    def env(self):
+        return {
+            "OPENAI_API_KEY": "stub",
+            "OPENAI_BASE_URL": f"{self.openai.url}/v1",
+            "PINECONE_API_KEY": "stub",
+            "PINECONE_INDEX": "stub",
+            "PINECONE_HOST": self.vector_index.url,
+        }
+
+    def request_counts(self):
+        return {**self.openai.requests, **self.vector_index.requests}
+
+    def seed(self, vectors):
+        # Load pre-chunked ruling vectors straight into the stub index
+        self.index.upsert([{
+            "id": v["id"],
+            "values": stub_embedding(v["metadata"]["text"]),
+            "metadata": v["metadata"]
+        } for v in vectors])
+
+    def shutdown(self):
+        for server in (self.openai, self.vector_index):
+            server.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local stand-ins for the OpenAI and Pinecone APIs")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="ms added to each embeddings call")
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="ms added to each chat call")
+    parser.add_argument("--query-latency", type=float, default=0.0, help="ms added to each index call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform random ms added on top")
+    args = parser.parse_args()
+
+    services = StubServices(args.embed_latency, args.chat_latency, args.query_latency, args.jitter)
+    print("Stub services running. Export these to point the app at them:")
+    for key, value in services.env().items():
+        print(f"  {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        services.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import requests
 import json
 import os
 from datetime import datetime, timedelta
+from tracing import span
+from router import LARGE_MODEL
 
 OUTPUT_FILE = "C:/customs_ai2/tariff_updates.json"
 FR_API = "https://www.federalregister.gov/api/v1/documents.json"
@@ -30,7 +32,10 @@ def fetch_recent_actions(days_back=365):
                 "order": "newest"
             }
             
-            response = requests.get(FR_API, params=params, timeout=15)
+            with span("monitor.fetch", term=config["term"]) as s:
+                response = requests.get(FR_API, params=params, timeout=15)
+                s.set(status=response.status_code)
+                s.add_bytes(bytes_in=len(response.content))
             if response.status_code != 200:
                 continue
                 
@@ -101,11 +106,14 @@ Format:
   }}
 ]"""
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=3000
-        )
+        with span("monitor.analyze", model=LARGE_MODEL, documents=len(actions)) as s:
+            response = client.chat.completions.create(
+                model=LARGE_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=3000
+            )
+            s.record_usage(response)
+            s.add_bytes(bytes_out=len(prompt.encode()), bytes_in=len(response.choices[0].message.content.encode()))
         
         text = response.choices[0].message.content.strip()
         text = text.replace("```json", "").replace("```", "").strip()
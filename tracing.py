@@ -0,0 +1,325 @@
+import argparse
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUPS = 5
+METRICS_PORT = os.getenv("METRICS_PORT", "")
+
+# Latency histogram buckets in seconds, Prometheus style
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+# USD per 1M tokens (input, output)
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+
+_current = contextvars.ContextVar("current_span", default=None)
+_collector = contextvars.ContextVar("span_collector", default=None)
+_metrics_lock = threading.Lock()
+_metrics = {}
+_metrics_server = None
+_logger = None
+_logger_lock = threading.Lock()
+
+class Span:
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = dict(attrs)
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.error = ""
+        self.start = time.time()
+        self.duration = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add_tokens(self, tokens_in=0, tokens_out=0):
+        self.tokens_in += tokens_in or 0
+        self.tokens_out += tokens_out or 0
+
+    def add_bytes(self, bytes_out=0, bytes_in=0):
+        self.bytes_out += bytes_out or 0
+        self.bytes_in += bytes_in or 0
+
+    def record_usage(self, response):
+        # Works for both chat (prompt/completion) and embeddings (prompt only)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.add_tokens(getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+        model = getattr(response, "model", None)
+        if model and "model" not in self.attrs:
+            self.attrs["model"] = model
+
+    def cost(self):
+        model = self.attrs.get("model", "")
+        # Responses report dated snapshots, e.g. gpt-4o-2024-08-06
+        price = next((p for m, p in sorted(MODEL_PRICES.items(), key=lambda i: -len(i[0]))
+                      if model.startswith(m)), None)
+        if price is None:
+            return 0.0
+        return (self.tokens_in * price[0] + self.tokens_out * price[1]) / 1e6
+
+    def to_dict(self):
+        return {
+            "ts": self.start,
+            "name": self.name,
+            "duration_ms": round(self.duration * 1000, 3),
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "cost_usd": round(self.cost(), 8),
+            "error": self.error,
+            "attrs": self.attrs
+        }
+
+def _get_logger():
+    global _logger
+    if _logger is not None:
+        return _logger
+    with _logger_lock:
+        if _logger is not None:
+            return _logger
+        logger = logging.getLogger("customs_ai.trace")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        if TRACE_FILE and not logger.handlers:
+            try:
+                handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_MAX_BYTES,
+                                              backupCount=TRACE_BACKUPS, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+            except OSError as e:
+                print(f"Tracing disabled, cannot open {TRACE_FILE}: {e}")
+        _logger = logger
+        return _logger
+
+def _observe(span):
+    with _metrics_lock:
+        m = _metrics.get(span.name)
+        if m is None:
+            m = _metrics[span.name] = {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS),
+                                       "errors": 0, "tokens_in": 0, "tokens_out": 0,
+                                       "bytes_in": 0, "bytes_out": 0, "cost": 0.0}
+        m["count"] += 1
+        m["sum"] += span.duration
+        for i, bound in enumerate(BUCKETS):
+            if span.duration <= bound:
+                m["buckets"][i] += 1
+        m["errors"] += 1 if span.error else 0
+        m["tokens_in"] += span.tokens_in
+        m["tokens_out"] += span.tokens_out
+        m["bytes_in"] += span.bytes_in
+        m["bytes_out"] += span.bytes_out
+        m["cost"] += span.cost()
+
+@contextmanager
+def span(name, **attrs):
+    s = Span(name, _current.get(), **attrs)
+    token = _current.set(s)
+    start = time.perf_counter()
+    try:
+        yield s
+    except Exception as e:
+        s.error = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        s.duration = time.perf_counter() - start
+        _current.reset(token)
+        _observe(s)
+        collected = _collector.get()
+        if collected is not None:
+            collected.append(s)
+        _get_logger().info(json.dumps(s.to_dict()))
+
+def traced(name, **attrs):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **attrs):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def collect():
+    # Gather the spans finished in this context, e.g. one classification
+    spans = []
+    token = _collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _collector.reset(token)
+
+def stage_timings(spans):
+    timings = {}
+    for s in spans:
+        timings[s.name] = timings.get(s.name, 0.0) + s.duration
+    return timings
+
+def prometheus_text():
+    lines = []
+    with _metrics_lock:
+        items = sorted(_metrics.items())
+        for family, help_text, kind in [
+            ("customs_stage_duration_seconds", "Stage latency", "histogram"),
+            ("customs_stage_errors_total", "Stage errors", "counter"),
+            ("customs_stage_tokens_total", "Model tokens by direction", "counter"),
+            ("customs_stage_bytes_total", "Payload bytes by direction", "counter"),
+            ("customs_stage_cost_usd_total", "Estimated model spend", "counter"),
+        ]:
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            for name, m in items:
+                label = f'stage="{name}"'
+                if kind == "histogram":
+                    for bound, count in zip(BUCKETS, m["buckets"]):
+                        lines.append(f'{family}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f'{family}_bucket{{{label},le="+Inf"}} {m["count"]}')
+                    lines.append(f"{family}_sum{{{label}}} {m['sum']:.6f}")
+                    lines.append(f"{family}_count{{{label}}} {m['count']}")
+                elif family.endswith("errors_total"):
+                    lines.append(f"{family}{{{label}}} {m['errors']}")
+                elif family.endswith("tokens_total"):
+                    lines.append(f'{family}{{{label},direction="in"}} {m["tokens_in"]}')
+                    lines.append(f'{family}{{{label},direction="out"}} {m["tokens_out"]}')
+                elif family.endswith("bytes_total"):
+                    lines.append(f'{family}{{{label},direction="in"}} {m["bytes_in"]}')
+                    lines.append(f'{family}{{{label},direction="out"}} {m["bytes_out"]}')
+                else:
+                    lines.append(f"{family}{{{label}}} {m['cost']:.8f}")
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_metrics_server(port=None):
+    # Safe to call on every Streamlit rerun; only the first call binds
+    global _metrics_server
+    port = port or METRICS_PORT
+    if _metrics_server is not None or not port:
+        return _metrics_server
+    try:
+        _metrics_server = ThreadingHTTPServer(("127.0.0.1", int(port)), MetricsHandler)
+    except OSError as e:
+        print(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+    _metrics_server.daemon_threads = True
+    threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+    return _metrics_server
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+def load_trace_files(path):
+    # Oldest rotated file first so records come out in time order
+    paths = [f"{path}.{n}" for n in range(TRACE_BACKUPS, 0, -1)] + [path]
+    records = []
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+def report(path, since_hours=0.0, prefix=""):
+    records = load_trace_files(path)
+    if since_hours:
+        cutoff = time.time() - since_hours * 3600
+        records = [r for r in records if r["ts"] >= cutoff]
+    if prefix:
+        records = [r for r in records if r["name"].startswith(prefix)]
+    if not records:
+        print(f"No spans found in {path}")
+        return
+
+    stages = {}
+    for r in records:
+        stages.setdefault(r["name"], []).append(r)
+
+    print(f"{len(records):,} spans from {path}\n")
+    print(f"{'stage':28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err':>6}"
+          f"{'tok in':>10}{'tok out':>10}{'MB in':>8}{'cost $':>10}")
+    total_cost = 0.0
+    for name in sorted(stages):
+        rs = stages[name]
+        ms = [r["duration_ms"] for r in rs]
+        cost = sum(r.get("cost_usd", 0.0) for r in rs)
+        total_cost += cost
+        print(f"{name:28}{len(rs):>8,}{percentile(ms, 50):>10.1f}{percentile(ms, 95):>10.1f}"
+              f"{percentile(ms, 99):>10.1f}{sum(1 for r in rs if r.get('error')):>6}"
+              f"{sum(r.get('tokens_in', 0) for r in rs):>10,}{sum(r.get('tokens_out', 0) for r in rs):>10,}"
+              f"{sum(r.get('bytes_in', 0) for r in rs) / 1e6:>8.2f}{cost:>10.4f}")
+    print(f"\nEstimated model spend: ${total_cost:.4f}")
+
+    print("\nLatency histograms (ms)")
+    for name in sorted(stages):
+        ms = [r["duration_ms"] for r in stages[name]]
+        counts = [0] * (len(BUCKETS) + 1)
+        for v in ms:
+            i = next((i for i, b in enumerate(BUCKETS) if v <= b * 1000), len(BUCKETS))
+            counts[i] += 1
+        peak = max(counts)
+        print(f"  {name}")
+        for i, count in enumerate(counts):
+            if not count:
+                continue
+            label = f"<= {BUCKETS[i] * 1000:g}" if i < len(BUCKETS) else f"> {BUCKETS[-1] * 1000:g}"
+            print(f"    {label:>10} {count:>7,} {'#' * max(1, round(30 * count / peak))}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize per-stage latency and cost from trace files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rep = sub.add_parser("report")
+    rep.add_argument("--file", default=TRACE_FILE or "traces.jsonl")
+    rep.add_argument("--since", type=float, default=0.0, help="only the last N hours")
+    rep.add_argument("--prefix", default="", help="only stages starting with this, e.g. classify.")
+    args = parser.parse_args()
+    if args.command == "report":
+        report(args.file, args.since, args.prefix)
+
+if __name__ == "__main__":
+    main()
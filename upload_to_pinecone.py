@@ -1,83 +1,164 @@
+import argparse
 import json
 import os
 import time
+from itertools import islice
 from dotenv import load_dotenv
 from openai import OpenAI
 from pinecone import Pinecone
+from chunking import chunk_ruling, is_truncated, MAX_CHUNKS_PER_RULING
+from corpus import Corpus, CORPUS_FILE
+from tracing import span
 
 load_dotenv('C:/customs_ai2/.env')
 
 openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
-index = pc.Index(os.getenv('PINECONE_INDEX'))
+index = pc.Index(os.getenv('PINECONE_INDEX'), host=os.getenv('PINECONE_HOST', ''))
 
 BATCH_SIZE = 100
 EMBEDDING_BATCH = 100
+# Rulings chunked per step; their chunks are embedded EMBEDDING_BATCH at a time
+RULING_BATCH = 25
 
 def get_embeddings_batch(texts):
-    response = openai_client.embeddings.create(
-        input=texts,
-        model="text-embedding-ada-002"
-    )
+    with span("upload.embed", model="text-embedding-ada-002", inputs=len(texts)) as s:
+        response = openai_client.embeddings.create(
+            input=texts,
+            model="text-embedding-ada-002"
+        )
+        s.record_usage(response)
+        s.add_bytes(bytes_out=sum(len(t.encode()) for t in texts))
     return [r.embedding for r in response.data]
 
+RULINGS_FILE = 'C:/customs_ai2/rulings.json'
+PROGRESS_FILE = 'C:/customs_ai2/upload_chunks_progress.json'
+
+def vector_metadata(chunk, ids_only):
+    # With --ids-only, vectors only say which chunk of which ruling they are
+    # and the query side reads the text back from the corpus
+    if ids_only:
+        return {"ruling_number": chunk['ruling_number'], "chunk": chunk['chunk']}
+    return {
+        "ruling_number": chunk['ruling_number'],
+        "chunk": chunk['chunk'],
+        "text": chunk['text'],
+        "url": chunk['url']
+    }
+
 def main():
+    parser = argparse.ArgumentParser(description="Chunk, embed and upload rulings to Pinecone")
+    parser.add_argument("--corpus", nargs="?", const=CORPUS_FILE, default="",
+                        help=f"stream rulings from a corpus file (default {CORPUS_FILE}) instead of {RULINGS_FILE}")
+    parser.add_argument("--ids-only", action="store_true",
+                        help="store only ruling_number and chunk as metadata; queries then need the same corpus")
+    args = parser.parse_args()
+    if args.ids_only and not args.corpus:
+        parser.error("--ids-only needs --corpus, so the text can be read back at query time")
+
     print("Loading rulings...")
-    with open('C:/customs_ai2/rulings.json', 'r') as f:
-        rulings = json.load(f)
+    with span("upload.load"):
+        if args.corpus:
+            corpus = Corpus(args.corpus)
+            total = len(corpus)
+        else:
+            corpus = None
+            with open(RULINGS_FILE, 'r') as f:
+                rulings = json.load(f)
+            total = len(rulings)
+    source_file = args.corpus or RULINGS_FILE
     
-    total = len(rulings)
-    print(f"Total rulings to upload: {total:,}")
+    print(f"Total rulings to upload: {total:,} from {source_file}" + (" (ids-only metadata)" if args.ids_only else ""))
 
-    # Check progress file
-    progress_file = 'C:/customs_ai2/upload_progress.json'
+    # Check progress file. Positions differ between rulings.json and the
+    # deduplicated corpus, so progress only carries over for the same source
     start_index = 0
-    if os.path.exists(progress_file):
-        with open(progress_file) as f:
+    if os.path.exists(PROGRESS_FILE):
+        with open(PROGRESS_FILE) as f:
             progress = json.load(f)
+        if progress.get('source', RULINGS_FILE) == source_file:
             start_index = progress.get('last_index', 0)
-        print(f"Resuming from index {start_index:,}")
+            print(f"Resuming from index {start_index:,}")
+        else:
+            print(f"Progress file is for {progress.get('source', RULINGS_FILE)}; starting {source_file} from the beginning")
+
+    source = corpus.iter_rulings(start_index) if corpus else iter(rulings[start_index:])
+    total_chunks = 0
+    total_truncated = 0
+    # First batch that didn't fully upload; progress never moves past it so
+    # a resumed run picks it up again
+    failed_at = None
+    for i in range(start_index, total, RULING_BATCH):
+        batch_rulings = list(islice(source, RULING_BATCH))
+        with span("upload.chunk", rulings=len(batch_rulings)) as s:
+            chunks = [c for ruling in batch_rulings for c in chunk_ruling(ruling)]
+            truncated = sum(1 for ruling in batch_rulings if is_truncated(ruling))
+            s.set(chunks=len(chunks), truncated=truncated)
 
-    for i in range(start_index, total, EMBEDDING_BATCH):
-        batch_rulings = rulings[i:i + EMBEDDING_BATCH]
-        texts = [r['text'][:8000] for r in batch_rulings]
-        
         try:
-            embeddings = get_embeddings_batch(texts)
+            embeddings = []
+            for k in range(0, len(chunks), EMBEDDING_BATCH):
+                embeddings.extend(get_embeddings_batch(
+                    [c['text'] for c in chunks[k:k + EMBEDDING_BATCH]]))
         except Exception as e:
             print(f"Embedding error at {i}: {e}")
+            failed_at = i if failed_at is None else failed_at
             time.sleep(5)
             continue
 
         vectors = []
-        for j, (ruling, embedding) in enumerate(zip(batch_rulings, embeddings)):
+        for chunk, embedding in zip(chunks, embeddings):
             vectors.append({
-                "id": ruling['ruling_number'],
+                "id": chunk['id'],
                 "values": embedding,
-                "metadata": {
-                    "ruling_number": ruling['ruling_number'],
-                    "text": ruling['text'][:2000],
-                    "url": ruling.get('url', '')
-                }
+                "metadata": vector_metadata(chunk, args.ids_only)
             })
 
         # Upload to Pinecone in batches of 100
+        upsert_failed = False
         for k in range(0, len(vectors), BATCH_SIZE):
             pinecone_batch = vectors[k:k + BATCH_SIZE]
             try:
-                index.upsert(vectors=pinecone_batch)
+                with span("upload.upsert", vectors=len(pinecone_batch)) as s:
+                    index.upsert(vectors=pinecone_batch)
+                    s.add_bytes(bytes_out=sum(len(v['values']) * 4 + len(json.dumps(v['metadata']))
+                                              for v in pinecone_batch))
             except Exception as e:
                 print(f"Pinecone error at {i+k}: {e}")
+                upsert_failed = True
                 time.sleep(5)
 
+        if upsert_failed:
+            # Keep the old single vectors until every chunk of the batch is in
+            print(f"Keeping legacy vectors for rulings {i:,}-{i + len(batch_rulings) - 1:,}; rerun to retry them")
+            failed_at = i if failed_at is None else failed_at
+            continue
+
+        # Drop the old one-vector-per-ruling entries so they don't compete
+        # with the chunks at query time
+        try:
+            with span("upload.delete", ids=len(batch_rulings)):
+                index.delete(ids=[r['ruling_number'] for r in batch_rulings])
+        except Exception as e:
+            print(f"Pinecone delete error at {i}: {e}")
+
         # Save progress
-        with open(progress_file, 'w') as f:
-            json.dump({'last_index': i + EMBEDDING_BATCH}, f)
+        if failed_at is None:
+            with open(PROGRESS_FILE, 'w') as f:
+                json.dump({'last_index': i + RULING_BATCH, 'source': source_file}, f)
 
-        print(f"Uploaded {min(i + EMBEDDING_BATCH, total):,}/{total:,} rulings")
+        total_chunks += len(chunks)
+        total_truncated += truncated
+        print(f"Uploaded {min(i + RULING_BATCH, total):,}/{total:,} rulings ({total_chunks:,} chunks this run)")
         time.sleep(0.5)
 
-    print(f"\nDone! All {total:,} rulings uploaded to Pinecone.")
+    if failed_at is not None:
+        print(f"\nFinished with errors; progress was kept at index {failed_at:,}. "
+              f"Rerun to retry from there (already uploaded chunks are overwritten).")
+    else:
+        print(f"\nDone! All {total:,} rulings uploaded to Pinecone.")
+    print(f"{total_truncated:,} rulings this run had more than {MAX_CHUNKS_PER_RULING} chunks; "
+          f"their middle sections were not indexed.")
 
 if __name__ == "__main__":
     main()